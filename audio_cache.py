@@ -0,0 +1,176 @@
+"""
+Content-addressed disk cache of soundboard audio.
+
+    <AUDIO_CACHE_DIR>/objects/<sha256>   the audio, stored once however many sounds share it
+    <AUDIO_CACHE_DIR>/sounds/<sound id>  the sha256 of that sound's audio
+
+Files are written to a temporary name and renamed into place, so readers never see partial audio.
+Objects are evicted least recently used first once the cache grows past AUDIO_CACHE_MAX_MB.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import discord
+
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def _write_atomic(path: str, data: bytes):
+    directory = os.path.dirname(path)
+    fd, partial = tempfile.mkstemp(dir=directory, prefix=".partial-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(partial, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial)
+        raise
+
+
+def _hash_file(path: str):
+    """sha256 of a file, read through a memory map instead of into a buffer"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+class AudioCache:
+    """Soundboard audio on disk, keyed by sound id and content hash, with a size-capped LRU"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._objects = OrderedDict()  # sha256 -> size in bytes, least recently used first
+        self._size = 0
+        self._verified = set()  # objects whose content was checked against their name this run
+        self._loaded = False
+        self._downloads = SingleFlight()  # by sound id
+        # All index and file work runs on this one thread, so the LRU needs no locking
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-cache")
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    @property
+    def size(self):
+        return self._size
+
+    def _object_path(self, digest: str):
+        return os.path.join(self.directory, "objects", digest)
+
+    def _sound_path(self, sound_id: int):
+        return os.path.join(self.directory, "sounds", str(sound_id))
+
+    def _load(self):
+        # Runs once: rebuild the LRU from the objects on disk, oldest access first
+        if self._loaded:
+            return
+        os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, "sounds"), exist_ok=True)
+        entries = []
+        with os.scandir(os.path.join(self.directory, "objects")) as it:
+            for entry in it:
+                if entry.name.startswith(".partial-"):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(entry.path)
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, digest, size in sorted(entries):
+            self._objects[digest] = size
+            self._size += size
+        self._loaded = True
+
+    async def path(self, sound: discord.SoundboardSound):
+        """Return the path of the sound's audio on disk, downloading it on a miss"""
+        if not self._loaded:
+            await self._run(self._load)
+
+        path = await self._run(self._lookup, sound.id)
+        if path:
+            return path
+
+        return await self._downloads.run(sound.id, lambda: self._download(sound))
+
+    async def invalidate(self, sound_id: int):
+        """Forget which audio a sound has, e.g. after it was updated; the next use downloads and re-hashes it"""
+        await self._run(self._forget, sound_id)
+
+    def _forget(self, sound_id: int):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._sound_path(sound_id))
+
+    def _lookup(self, sound_id: int):
+        try:
+            with open(self._sound_path(sound_id)) as f:
+                digest = f.read().strip()
+        except FileNotFoundError:
+            return None
+        path = self._object_path(digest)
+        if digest not in self._objects or not os.path.exists(path):
+            return None
+        if digest not in self._verified:
+            # Catch objects corrupted on disk before anything plays them
+            if _hash_file(path) != digest:
+                logger.warning(f"Cached audio {digest} is corrupt, downloading sound {sound_id} again")
+                self._remove(digest)
+                return None
+            self._verified.add(digest)
+        self._touch(digest)
+        return path
+
+    async def _download(self, sound: discord.SoundboardSound):
+        data = await sound.read()
+        return await self._run(self._store, sound.id, data)
+
+    def _store(self, sound_id: int, data: bytes):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if digest not in self._objects or not os.path.exists(path):
+            _write_atomic(path, data)
+            self._size += len(data) - self._objects.get(digest, 0)
+            self._objects[digest] = len(data)
+        self._verified.add(digest)
+        self._touch(digest)
+        _write_atomic(self._sound_path(sound_id), digest.encode())
+        self._evict(keep=digest)
+        return path
+
+    def _touch(self, digest: str):
+        self._objects.move_to_end(digest)
+        # mtime records the last use so the order survives restarts
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(self._object_path(digest))
+
+    def _remove(self, digest: str):
+        self._size -= self._objects.pop(digest, 0)
+        self._verified.discard(digest)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._object_path(digest))
+
+    def _evict(self, keep: str):
+        # Sound files pointing at an evicted object are left behind; _lookup treats them as misses
+        while self._size > self.max_bytes and len(self._objects) > 1:
+            digest = next(iter(self._objects))
+            if digest == keep:
+                break
+            self._remove(digest)
+
+
+audio_cache = AudioCache(
+    directory=os.getenv("AUDIO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "soundboard-audio")),
+    max_bytes=int(os.getenv("AUDIO_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
@@ -0,0 +1,144 @@
+"""
+Offline benchmark of the combination data paths against fake guilds and a throwaway database.
+
+    BENCH_DB_NAME=soundbench python -m benchmarks.bench_combinations --guilds 1,10 --combinations 10,100
+
+Every table in BENCH_DB_NAME is truncated between scenarios, so never point it at real data.
+The other DB_* variables from .env (host, user, password) are reused.
+With STORAGE_BACKEND=sqlite the benchmark runs against a temporary SQLite file instead.
+
+    STORAGE_BACKEND=sqlite python -m benchmarks.bench_combinations
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+
+from benchmarks.harness import use_bench_database
+
+use_bench_database("bench.db", "the benchmark")
+# Sounds are stubbed, so don't wait between them
+os.environ.setdefault("PLAYBACK_GAP", "0")
+
+from benchmarks.harness import FakeClient, FakeGuild, FakeInteraction, FakeUser, measure
+from combination_cache import combination_cache
+from dispatcher import SoundDispatcher
+from commands.create_combination import SoundboardCreateCombinations
+from commands.delete_combination import delete_combination
+from commands.list_combinations import ListCombinationsCog
+from commands.play_combinations import PlayCombinationsCog, play_combination
+from commands.utils import fetched_combinations
+from playback import PlaybackManager
+from sound_metadata import sound_metadata
+from storage import store
+from voice_sessions import VoiceSessionManager
+
+
+def parse_sizes(value: str):
+    return [int(size) for size in value.split(",") if size]
+
+
+async def reset_database():
+    await store.truncate()
+
+
+async def run_scenario(guild_count: int, combination_count: int, sounds_per_combination: int, concurrency: int):
+    await reset_database()
+    voice_sessions = VoiceSessionManager(idle_timeout=0.05, max_idle=guild_count)
+    # Generous send limits: the benchmark measures the bot, not the throttling
+    dispatcher = SoundDispatcher(global_rate=1e6, global_burst=1e6, guild_rate=1e6, guild_burst=1e6)
+    players = PlaybackManager(voice_sessions, dispatcher, idle_timeout=0.05, max_queue_size=1_000_000)
+    client = FakeClient(players, voice_sessions)
+    guilds = [FakeGuild(10_000 + index, sound_count=max(sounds_per_combination, 1)) for index in range(guild_count)]
+    for guild in guilds:
+        combination_cache.invalidate(guild.id)
+        for sound_id in guild.sounds:
+            sound_metadata._durations[sound_id] = 0.0
+
+    def interaction(guild):
+        return FakeInteraction(client, guild, FakeUser(1, guild.voice_channel))
+
+    names = [f"combination-{index}" for index in range(combination_count)]
+    pairs = list(itertools.product(guilds, names))
+    list_cog = ListCombinationsCog(None)
+    play_cog = PlayCombinationsCog(None)
+
+    async def save(guild, name):
+        view = SoundboardCreateCombinations(name, {sound.name: sound for sound in guild.sounds.values()})
+        view.selected_sounds = list(guild.sounds.values())[:sounds_per_combination]
+        await view.save_combination(name, interaction(guild))
+
+    async def fetch_cold(guild):
+        combination_cache.invalidate(guild.id)
+        await fetched_combinations(guild.id)
+
+    async def fetch_warm(guild):
+        await fetched_combinations(guild.id)
+
+    async def list_handler(guild):
+        await list_cog.list_combinations.callback(list_cog, interaction(guild))
+
+    async def play_handler(guild):
+        await play_cog.play_created_combinations.callback(play_cog, interaction(guild))
+
+    async def play_button(guild, name):
+        await play_combination(interaction(guild), name)
+
+    async def delete(guild, name):
+        await delete_combination(interaction(guild), name)
+
+    results = {}
+    results["save_combination"] = await measure(save, pairs, concurrency)
+    results["fetched_combinations (cold)"] = await measure(fetch_cold, [(guild,) for guild in guilds], concurrency)
+    results["fetched_combinations (warm)"] = await measure(fetch_warm, [(guild,) for guild in guilds], concurrency)
+    results["/list_combinations"] = await measure(list_handler, [(guild,) for guild in guilds], concurrency)
+    results["/play_created_combinations"] = await measure(play_handler, [(guild,) for guild in guilds], concurrency)
+    results["play combination button"] = await measure(play_button, pairs, concurrency)
+    results["delete combination button"] = await measure(delete, pairs, concurrency)
+
+    # Let the players drain and the idle voice connections close before the next scenario
+    while client.players.active_count or voice_sessions.idle_count:
+        await asyncio.sleep(0.05)
+    return results
+
+
+def print_results(scenario, results):
+    guilds, combinations, sounds = scenario
+    print(f"\n== {guilds} guilds x {combinations} combinations x {sounds} sounds ==")
+    print(f"{'operation':<30} {'ops':>7} {'ops/sec':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for operation, stats in results.items():
+        print(
+            f"{operation:<30} {stats['ops']:>7} {stats['ops_per_sec']:>10.1f} {stats['p50_ms']:>9.2f} "
+            f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the combination data paths")
+    parser.add_argument("--guilds", default="1,10", help="comma separated guild counts")
+    parser.add_argument("--combinations", default="10,100", help="comma separated combinations per guild")
+    parser.add_argument("--sounds", default="5", help="comma separated sounds per combination")
+    parser.add_argument("--concurrency", type=int, default=8, help="operations in flight at once")
+    parser.add_argument("--json", metavar="FILE", help="also write the results to FILE as JSON")
+    args = parser.parse_args()
+
+    await store.open()
+    try:
+        report = []
+        for scenario in itertools.product(parse_sizes(args.guilds), parse_sizes(args.combinations), parse_sizes(args.sounds)):
+            results = await run_scenario(*scenario, concurrency=args.concurrency)
+            print_results(scenario, results)
+            report.append({"guilds": scenario[0], "combinations": scenario[1], "sounds": scenario[2], "results": results})
+        await reset_database()
+    finally:
+        await store.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+"""
+Stand-ins for the discord.py objects the cogs touch, plus timing helpers for the benchmarks.
+Only the attributes and coroutines the bot actually uses are implemented.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+
+def use_bench_database(sqlite_name: str, truncated_by: str):
+    """Point the storage settings at the throwaway database; call before importing the bot's modules"""
+    load_dotenv()
+    if os.getenv("STORAGE_BACKEND", "postgres").lower() == "sqlite":
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="soundbench-"), sqlite_name)
+    elif not os.getenv("BENCH_DB_NAME"):
+        sys.exit(f"Set BENCH_DB_NAME to a throwaway database; its tables are truncated by {truncated_by}.")
+    else:
+        os.environ["DB_NAME"] = os.environ["BENCH_DB_NAME"]
+
+
+class FakeSound:
+    def __init__(self, sound_id: int, name: str):
+        self.id = sound_id
+        self.name = name
+        self.emoji = None
+
+    async def read(self):
+        return b""
+
+
+class FakeVoiceClient:
+    def __init__(self, guild, channel):
+        self.guild = guild
+        self.channel = channel
+
+    def is_connected(self):
+        return self.guild.voice_client is self
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, force: bool = False):
+        if self.guild.voice_client is self:
+            self.guild.voice_client = None
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, channel_id: int, send_delay: float = 0.0):
+        self.guild = guild
+        self.id = channel_id
+        self.send_delay = send_delay
+        self.sent = 0
+
+    async def connect(self):
+        self.guild.voice_client = FakeVoiceClient(self.guild, self)
+        return self.guild.voice_client
+
+    async def send_sound(self, sound):
+        # Stub for the soundboard REST call; optionally simulate its round trip
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.sent += 1
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, sound_count: int, member_count: int = 50, send_delay: float = 0.0):
+        self.id = guild_id
+        self.name = f"bench-guild-{guild_id}"
+        self.member_count = member_count
+        self.voice_client = None
+        self.voice_channel = FakeVoiceChannel(self, guild_id * 10, send_delay)
+        self.sounds = {
+            guild_id * 1000 + index: FakeSound(guild_id * 1000 + index, f"sound-{index}")
+            for index in range(sound_count)
+        }
+
+    def get_soundboard_sound(self, sound_id: int):
+        return self.sounds.get(sound_id)
+
+    async def fetch_soundboard_sounds(self):
+        return list(self.sounds.values())
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeUser:
+    def __init__(self, user_id: int, voice_channel=None):
+        self.id = user_id
+        self.voice = FakeVoiceState(voice_channel) if voice_channel else None
+
+
+class FakeResponse:
+    """Records what the handler sent and when the interaction was first acknowledged"""
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.messages = []
+        self.acked_at = None
+
+    def is_done(self):
+        return self.acked_at is not None
+
+    def _ack(self, content, kwargs):
+        if self.acked_at is None:
+            self.acked_at = time.perf_counter()
+        self.messages.append((content, kwargs))
+
+    async def send_message(self, content=None, **kwargs):
+        self._ack(content, kwargs)
+
+    async def edit_message(self, **kwargs):
+        self._ack(None, kwargs)
+
+    async def defer(self, **kwargs):
+        self._ack(None, kwargs)
+
+
+class FakeInteraction:
+    def __init__(self, client, guild, user):
+        self.client = client
+        self.guild = guild
+        self.user = user
+        self.command = None
+        self.extras = {}
+        self.created_at = time.perf_counter()
+        self.response = FakeResponse(self)
+
+    async def edit_original_response(self, **kwargs):
+        self.response.messages.append((kwargs.get("content"), kwargs))
+
+    @property
+    def ack_latency(self):
+        """Seconds from creating the interaction to its first response"""
+        if self.response.acked_at is None:
+            return None
+        return self.response.acked_at - self.created_at
+
+
+class FakeClient:
+    """The attributes main.py attaches to the bot that cogs reach through interaction.client"""
+
+    def __init__(self, players, voice_sessions):
+        self.players = players
+        self.voice_sessions = voice_sessions
+
+
+def percentile(sorted_values, fraction: float):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(latencies):
+    """Count and latency percentiles (milliseconds) of a list of latencies in seconds"""
+    ordered = sorted(latencies)
+    return {
+        "ops": len(ordered),
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+    }
+
+
+def summarize(latencies, elapsed: float):
+    """ops/sec and latency percentiles (milliseconds) for one measured run"""
+    return {
+        "ops_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        **latency_summary(latencies),
+    }
+
+
+async def measure(operation, arguments, concurrency: int = 1):
+    """Await operation(*args) for every args tuple with bounded concurrency; returns summarize()"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def run(args):
+        async with semaphore:
+            started = time.perf_counter()
+            await operation(*args)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(args) for args in arguments))
+    return summarize(latencies, time.perf_counter() - started)
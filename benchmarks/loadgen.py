@@ -0,0 +1,338 @@
+"""
+End-to-end load generator: drives the real cogs, player, dispatcher, caches and database with a
+mix of interactions across thousands of fake guilds, and reports how the whole bot holds up.
+
+    BENCH_DB_NAME=soundbench python -m benchmarks.loadgen --guilds 2000 --rate 500 --duration 30
+
+Interactions arrive open loop (Poisson, at --rate per second) and busy guilds get most of them.
+Sending a sound is stubbed with a --send-delay round trip; everything else is the bot's own code,
+including the send rate limits from the SEND_* settings. The report covers interaction ack
+latency per operation, event loop lag, memory growth and database pool saturation.
+
+Every table in BENCH_DB_NAME is truncated first, so never point it at real data.
+With STORAGE_BACKEND=sqlite it runs against a temporary SQLite file instead.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+from benchmarks.harness import use_bench_database
+
+use_bench_database("loadgen.db", "the load generator")
+
+from benchmarks.harness import FakeClient, FakeGuild, FakeInteraction, FakeUser, latency_summary
+from commands.create_combination import CreateCombinationCog, SoundboardCreateCombinations
+from commands.delete_combination import delete_combination
+from commands.play_combinations import PlayCombinationsCog, play_combination
+from commands.soundboard import PlayQueueButton, SoundButton, SoundboardCog
+from dispatcher import create_dispatcher
+from playback import PlaybackManager
+from sound_metadata import sound_metadata
+from storage import store
+from voice_sessions import VoiceSessionManager
+
+# Relative frequency of each operation; clicking sounds dominates real traffic
+OPERATIONS = {
+    "soundboard button": 40,
+    "play queue button": 8,
+    "/soundboard": 8,
+    "play combination": 16,
+    "/play_created_combinations": 5,
+    "combination autocomplete": 8,
+    "/create_combination + save": 8,
+    "delete combination": 7,
+}
+
+USERS_PER_GUILD = 20
+
+
+class Sampler:
+    """Samples event loop lag and database pool usage at a fixed interval"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags = []
+        self.requests_waiting = []
+        self.pool_exhausted = 0
+        self.samples = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+            stats = store.pool_stats()
+            if stats:
+                self.samples += 1
+                self.requests_waiting.append(stats.get("requests_waiting", 0))
+                if stats.get("pool_available", 0) == 0 and stats.get("pool_size", 0) >= stats.get("pool_max", 0):
+                    self.pool_exhausted += 1
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        voice_sessions = VoiceSessionManager(idle_timeout=float(os.getenv("VOICE_IDLE_TIMEOUT", "120")),
+                                             max_idle=int(os.getenv("VOICE_MAX_IDLE", "50")))
+        players = PlaybackManager(voice_sessions, create_dispatcher(),
+                                  idle_timeout=float(os.getenv("PLAYER_IDLE_TIMEOUT", "30")),
+                                  max_queue_size=int(os.getenv("MAX_QUEUE_SIZE", "50")))
+        self.client = FakeClient(players, voice_sessions)
+        self.guilds = [
+            FakeGuild(10_000 + index, sound_count=args.sounds, send_delay=args.send_delay)
+            for index in range(args.guilds)
+        ]
+        # Zipf-like popularity: the n-th guild gets 1/n of the first guild's traffic
+        self.cum_weights = []
+        total = 0.0
+        for rank in range(1, len(self.guilds) + 1):
+            total += 1 / rank
+            self.cum_weights.append(total)
+        self.combinations = {guild.id: [] for guild in self.guilds}  # names this run believes exist
+        self.created = 0
+        self.soundboard_cog = SoundboardCog(self.client)
+        self.play_cog = PlayCombinationsCog(self.client)
+        self.create_cog = CreateCombinationCog(self.client)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)  # operation -> "ExceptionType: message" -> count
+        self.responses = defaultdict(int)  # (operation, first line of the reply) -> count
+        self.in_flight = set()
+        self.dropped = 0
+
+    async def seed(self):
+        """Give every guild some saved combinations and every sound a known duration"""
+        await store.truncate()
+        rows = []
+        for guild in self.guilds:
+            sound_ids = list(guild.sounds)
+            for sound_id in sound_ids:
+                sound_metadata._durations[sound_id] = self.args.sound_duration
+            for index in range(self.args.combinations):
+                name = f"combination-{index}"
+                rows.append((guild.id, name, self.rng.sample(sound_ids, min(len(sound_ids), self.args.combination_size))))
+                self.combinations[guild.id].append(name)
+        for start in range(0, len(rows), 5000):
+            await store.upsert_combinations(rows[start:start + 5000])
+
+    def interaction(self, guild):
+        user = FakeUser(guild.id * 100 + self.rng.randrange(USERS_PER_GUILD), guild.voice_channel)
+        return FakeInteraction(self.client, guild, user)
+
+    async def run_operation(self, operation, guild):
+        interaction = self.interaction(guild)
+        started = time.perf_counter()
+        try:
+            if operation == "soundboard button":
+                await SoundButton(self.rng.choice(list(guild.sounds))).callback(interaction)
+            elif operation == "play queue button":
+                await PlayQueueButton().callback(interaction)
+            elif operation == "/soundboard":
+                await self.soundboard_cog.soundboard.callback(self.soundboard_cog, interaction)
+            elif operation == "play combination":
+                names = self.combinations[guild.id]
+                await play_combination(interaction, self.rng.choice(names) if names else "missing")
+            elif operation == "/play_created_combinations":
+                await self.play_cog.play_created_combinations.callback(self.play_cog, interaction)
+            elif operation == "combination autocomplete":
+                # Autocomplete answers with a return value, not a response
+                choices = await self.play_cog.name_autocomplete(interaction, "combination-1")
+                interaction.response._ack(f"{len(choices)} choices", {})
+            elif operation == "/create_combination + save":
+                name = f"load-{self.created}"
+                self.created += 1
+                await self.create_cog.create_combination.callback(self.create_cog, interaction, name)
+                view = SoundboardCreateCombinations(name, {sound.name: sound for sound in guild.sounds.values()})
+                view.selected_sounds = self.rng.sample(list(guild.sounds.values()), self.args.combination_size)
+                await view.save_combination(name, interaction)
+                self.combinations[guild.id].append(name)
+            elif operation == "delete combination":
+                names = self.combinations[guild.id]
+                name = names.pop(self.rng.randrange(len(names))) if names else "missing"
+                await delete_combination(interaction, name)
+        except Exception as e:
+            self.errors[operation][f"{type(e).__name__}: {e}"[:120]] += 1
+            return
+        latency = interaction.ack_latency
+        self.latencies[operation].append(latency if latency is not None else time.perf_counter() - started)
+        if interaction.response.messages:
+            content = interaction.response.messages[0][0] or "<view>"
+            # Group replies that only differ in the bold sound name or queue position
+            self.responses[(operation, re.sub(r"\*\*[^*]*\*\*", "…", content.splitlines()[0])[:60])] += 1
+
+    def spawn(self):
+        if len(self.in_flight) >= self.args.max_in_flight:
+            self.dropped += 1
+            return
+        guild = self.rng.choices(self.guilds, cum_weights=self.cum_weights)[0]
+        operation = self.rng.choices(list(OPERATIONS), weights=list(OPERATIONS.values()))[0]
+        task = asyncio.create_task(self.run_operation(operation, guild))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+
+    async def generate(self, duration: float):
+        """Start interactions at random intervals averaging 1/rate seconds for `duration` seconds"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + duration
+        next_at = loop.time()
+        while True:
+            next_at += self.rng.expovariate(self.args.rate)
+            if next_at >= deadline:
+                break
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.spawn()
+        if self.in_flight:
+            await asyncio.wait(set(self.in_flight))
+
+    async def stop(self):
+        players = self.client.players
+        players.close()
+        await players.stop()
+        await self.client.voice_sessions.close([guild.voice_client for guild in self.guilds if guild.voice_client])
+
+
+def rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def build_report(generator, sampler, elapsed, memory):
+    operations = {}
+    for operation in OPERATIONS:
+        errors = generator.errors[operation]
+        operations[operation] = {
+            **latency_summary(generator.latencies[operation]),
+            "errors": sum(errors.values()),
+            "error_types": dict(errors.most_common()),
+        }
+    completed = sum(len(latencies) for latencies in generator.latencies.values())
+    return {
+        "elapsed_s": elapsed,
+        "interactions_per_sec": completed / elapsed if elapsed else 0.0,
+        "dropped": generator.dropped,
+        "operations": operations,
+        "responses": {f"{operation}: {reply}": count for (operation, reply), count in sorted(generator.responses.items())},
+        "event_loop_lag": latency_summary(sampler.lags),
+        "memory": memory,
+        "db_pool": {
+            "samples": sampler.samples,
+            "exhausted_fraction": sampler.pool_exhausted / sampler.samples if sampler.samples else None,
+            "max_requests_waiting": max(sampler.requests_waiting, default=None),
+            "stats": store.pool_stats(),
+        },
+        "players_active": generator.client.players.active_count,
+        "sounds_sent": sum(guild.voice_channel.sent for guild in generator.guilds),
+    }
+
+
+def print_report(report):
+    print(f"\n== {report['interactions_per_sec']:.0f} interactions/sec over {report['elapsed_s']:.1f}s "
+          f"({report['dropped']} dropped at the in-flight cap), {report['sounds_sent']} sounds sent ==")
+    print(f"{'operation':<30} {'ops':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for operation, stats in report["operations"].items():
+        print(
+            f"{operation:<30} {stats['ops']:>7} {stats['errors']:>7} {stats['p50_ms']:>9.2f} "
+            f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}"
+        )
+    errors = [(operation, error, count) for operation, stats in report["operations"].items()
+              for error, count in stats["error_types"].items()]
+    if errors:
+        print("\nErrors:")
+        for operation, error, count in errors:
+            print(f"  {count:>7}  {operation}: {error}")
+    print("\nReplies:")
+    for reply, count in report["responses"].items():
+        print(f"  {count:>7}  {reply}")
+    lag = report["event_loop_lag"]
+    print(f"\nEvent loop lag: p50 {lag['p50_ms']:.2f} ms, p99 {lag['p99_ms']:.2f} ms, max {lag['max_ms']:.2f} ms")
+    memory = report["memory"]
+    print(f"Peak RSS: {memory['rss_before_mb']:.1f} MB after warmup -> {memory['rss_after_mb']:.1f} MB")
+    if "traced_growth_mb" in memory:
+        print(f"Python heap growth: {memory['traced_growth_mb']:.2f} MB (peak {memory['traced_peak_mb']:.1f} MB)")
+        for line in memory["top_growth"]:
+            print(f"  {line}")
+    pool = report["db_pool"]
+    if pool["samples"]:
+        print(f"DB pool: no free connection in {pool['exhausted_fraction']:.1%} of samples, "
+              f"up to {pool['max_requests_waiting']} requests waiting")
+    else:
+        print("DB pool: none (SQLite)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load test the bot with simulated guilds")
+    parser.add_argument("--guilds", type=int, default=2000, help="simulated guilds")
+    parser.add_argument("--rate", type=float, default=500, help="interactions started per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring")
+    parser.add_argument("--sounds", type=int, default=20, help="soundboard sounds per guild")
+    parser.add_argument("--combinations", type=int, default=10, help="combinations saved per guild up front")
+    parser.add_argument("--combination-size", type=int, default=4, help="sounds per combination")
+    parser.add_argument("--sound-duration", type=float, default=0.5, help="seconds each sound plays")
+    parser.add_argument("--send-delay", type=float, default=0.05, help="seconds the stubbed send_sound takes")
+    parser.add_argument("--max-in-flight", type=int, default=10000, help="interactions handled at once before new ones are dropped")
+    parser.add_argument("--tracemalloc", action="store_true", help="trace Python allocations (slows the bot down)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="FILE", help="also write the report to FILE as JSON")
+    args = parser.parse_args()
+
+    await store.open()
+    generator = LoadGenerator(args)
+    sampler = Sampler()
+    try:
+        await generator.seed()
+        await generator.generate(args.warmup)
+
+        memory = {"rss_before_mb": rss_mb()}
+        if args.tracemalloc:
+            tracemalloc.start()
+            baseline = tracemalloc.take_snapshot()
+        sampler.start()
+        started = time.perf_counter()
+        await generator.generate(args.duration)
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+
+        memory["rss_after_mb"] = rss_mb()
+        if args.tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            growth = snapshot.compare_to(baseline, "lineno")
+            memory["traced_growth_mb"] = sum(stat.size_diff for stat in growth) / (1024 * 1024)
+            memory["traced_peak_mb"] = peak / (1024 * 1024)
+            memory["top_growth"] = [str(stat) for stat in growth[:5]]
+
+        report = build_report(generator, sampler, elapsed, memory)
+        await generator.stop()
+        await store.truncate()
+    finally:
+        await store.close()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,168 @@
+"""
+Run the bot as several worker processes, each connecting a contiguous block of shards.
+
+    python cluster.py
+
+Every worker is a full bot process with its own database pool, caches and health server
+(on PORT + worker index). The supervisor restarts a worker that exits unexpectedly.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import urllib.request
+
+from dotenv import load_dotenv
+
+from log_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Discord allows one IDENTIFY per 5 seconds per bucket; stagger worker starts to match
+IDENTIFY_INTERVAL = 5.5
+# A worker that ran this long before crashing restarts without backoff
+STABLE_UPTIME = 300
+MAX_RESTART_DELAY = 300
+
+
+def recommended_shard_count(token: str):
+    """Ask Discord how many shards the bot should run"""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "sound-combinator cluster"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+
+def split_shards(shard_count: int, processes: int):
+    """Split shard ids 0..shard_count-1 into at most `processes` contiguous blocks"""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    blocks, start = [], 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        blocks.append(list(range(start, end)))
+        start = end
+    return blocks
+
+
+def run_worker(index: int, shard_ids, shard_count: int, port: int, delay: float):
+    """Entry point of a worker process"""
+    import asyncio
+
+    # Let SIGTERM from the supervisor unwind like Ctrl+C so the bot closes its pool and connections
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    os.environ["PORT"] = str(port)
+    os.environ["CLUSTER_WORKER"] = str(index)
+    try:
+        if delay:
+            time.sleep(delay)
+        import main
+        asyncio.run(main.run_bot(shard_ids, shard_count))
+    except KeyboardInterrupt:
+        pass
+
+
+class Worker:
+    def __init__(self, index: int, shard_ids, shard_count: int, port: int):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.port = port
+        self.process = None
+        self.started_at = 0.0
+        self.restart_delay = 0.0
+        self.restart_at = None
+
+    def start(self, context, delay: float = 0.0):
+        self.process = context.Process(
+            target=run_worker,
+            args=(self.index, self.shard_ids, self.shard_count, self.port, delay),
+            name=f"bot-worker-{self.index}",
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        logger.info(f"Started worker {self.index} (pid {self.process.pid}) with shards {self.shard_ids}")
+
+
+class Supervisor:
+    def __init__(self, shard_count: int, processes: int, base_port: int):
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = [
+            Worker(index, shard_ids, shard_count, base_port + index)
+            for index, shard_ids in enumerate(split_shards(shard_count, processes))
+        ]
+        self.stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        delay = 0.0
+        for worker in self.workers:
+            worker.start(self.context, delay)
+            delay += IDENTIFY_INTERVAL * len(worker.shard_ids)
+
+        while not self.stopping:
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.restart_at is not None:
+                    if now >= worker.restart_at:
+                        worker.start(self.context)
+                elif not worker.process.is_alive():
+                    self.schedule_restart(worker, now)
+            time.sleep(1)
+
+        self.shutdown()
+
+    def schedule_restart(self, worker: Worker, now: float):
+        uptime = now - worker.started_at
+        if uptime >= STABLE_UPTIME:
+            worker.restart_delay = 0.0
+        worker.restart_delay = min(MAX_RESTART_DELAY, max(IDENTIFY_INTERVAL, worker.restart_delay * 2))
+        worker.restart_at = now + worker.restart_delay
+        logger.warning(
+            f"Worker {worker.index} exited with code {worker.process.exitcode} after {uptime:.0f}s; "
+            f"restarting in {worker.restart_delay:.0f}s"
+        )
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+
+    def shutdown(self, timeout: float = 30):
+        logger.info("Stopping workers")
+        for worker in self.workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+
+
+def main():
+    load_dotenv()
+    setup_logging()
+
+    token = os.getenv("DISCORD_TOKEN")
+    if not token:
+        raise ValueError("DISCORD_TOKEN not found in .env file. Please add your bot token to the .env file.")
+
+    shard_count = os.getenv("SHARD_COUNT", "auto")
+    shard_count = recommended_shard_count(token) if shard_count == "auto" else int(shard_count)
+    processes = int(os.getenv("CLUSTER_PROCESSES") or os.cpu_count() or 1)
+    base_port = int(os.getenv("PORT", "8080"))
+
+    logger.info(f"Running {shard_count} shard(s) across {min(processes, shard_count)} worker process(es)")
+    Supervisor(shard_count, processes, base_port).run()
+
+
+if __name__ == "__main__":
+    main()
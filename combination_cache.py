@@ -0,0 +1,117 @@
+import os
+import time
+from collections import OrderedDict
+
+from prefix_index import PrefixIndex
+
+
+class CombinationCache:
+    """Per-guild combinations ({name: [sound ids]}) with a TTL and LRU eviction bounded by total size"""
+
+    def __init__(self, max_weight: int, ttl: float):
+        # Weight of a guild = combinations + sound ids it holds, a proxy for its memory use
+        self.max_weight = max_weight
+        # Writes from this process update the cache directly; the TTL picks up other processes' writes
+        self.ttl = ttl
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        # guild id -> (weight, {name: [sound ids]}, PrefixIndex of the names, expires_at)
+        self._entries = OrderedDict()
+        # guild id -> count of writes and invalidations, so a fetch that raced one is not cached
+        self._generations = {}
+
+    def _live(self, guild_id: int):
+        entry = self._entries.get(guild_id)
+        if entry is not None and entry[3] <= time.monotonic():
+            self._remove(guild_id)
+            return None
+        return entry
+
+    def get(self, guild_id: int):
+        """Return the guild's cached combinations, or None on a miss"""
+        entry = self._live(guild_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(guild_id)
+        return entry[1]
+
+    def names(self, guild_id: int):
+        """Prefix index of the guild's combination names, or None if the guild is not cached"""
+        entry = self._live(guild_id)
+        return entry[2] if entry is not None else None
+
+    def generation(self, guild_id: int):
+        """Read before fetching a guild's combinations and hand to put()"""
+        return self._generations.get(guild_id, 0)
+
+    def put(self, guild_id: int, combinations: dict, generation: int):
+        """Cache freshly fetched combinations, unless a write or invalidation happened since `generation`"""
+        if generation != self.generation(guild_id):
+            return
+        self._put(guild_id, combinations, PrefixIndex(combinations), time.monotonic() + self.ttl)
+
+    def add(self, guild_id: int, name: str, sound_ids):
+        """Write-through for a newly saved combination"""
+        self._bump(guild_id)
+        entry = self._live(guild_id)
+        if entry is not None:
+            # Copy instead of mutating: open views may still hold the previous dict. The index is
+            # private to the cache, so it is updated in place instead of being rebuilt.
+            entry[2].add(name)
+            self._put(guild_id, {**entry[1], name: list(sound_ids)}, entry[2], entry[3])
+
+    def discard(self, guild_id: int, name: str):
+        """Write-through for a deleted combination"""
+        self._bump(guild_id)
+        entry = self._live(guild_id)
+        if entry is not None and name in entry[1]:
+            combinations = dict(entry[1])
+            del combinations[name]
+            entry[2].discard(name)
+            self._put(guild_id, combinations, entry[2], entry[3])
+
+    def invalidate(self, guild_id: int):
+        self._bump(guild_id)
+        self._remove(guild_id)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "guilds": len(self._entries),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    def _bump(self, guild_id: int):
+        self._generations[guild_id] = self.generation(guild_id) + 1
+
+    def _put(self, guild_id: int, combinations: dict, names: PrefixIndex, expires_at: float):
+        self._remove(guild_id)
+        weight = self._weigh(combinations)
+        if weight > self.max_weight:
+            return
+        self._entries[guild_id] = (weight, combinations, names, expires_at)
+        self.weight += weight
+        while self.weight > self.max_weight:
+            _, (evicted_weight, _, _, _) = self._entries.popitem(last=False)
+            self.weight -= evicted_weight
+
+    def _remove(self, guild_id: int):
+        entry = self._entries.pop(guild_id, None)
+        if entry is not None:
+            self.weight -= entry[0]
+
+    @staticmethod
+    def _weigh(combinations: dict):
+        return sum(1 + len(sound_ids) for sound_ids in combinations.values()) or 1
+
+
+combination_cache = CombinationCache(
+    max_weight=int(os.getenv("COMBINATION_CACHE_MAX_WEIGHT", "200000")),
+    ttl=float(os.getenv("COMBINATION_CACHE_TTL", "300")),
+)
@@ -0,0 +1,41 @@
+import hashlib
+import json
+import logging
+
+from storage import store
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = "command_tree_hash"
+
+
+def command_tree_hash(tree):
+    """Hash of the global command payload Discord would receive from tree.sync()"""
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda command: command["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+async def stored_hash():
+    return await store.get_state(STATE_KEY)
+
+
+async def store_hash(value: str):
+    await store.set_state(STATE_KEY, value)
+
+
+async def sync_commands(tree):
+    """Push the global command tree to Discord and remember what was pushed"""
+    synced = await tree.sync()
+    await store_hash(command_tree_hash(tree))
+    logger.info(f"Synced {len(synced)} command(s)")
+    return synced
+
+
+async def sync_if_changed(tree):
+    """Sync only when the local command tree differs from the last synced one; True if it synced"""
+    current = command_tree_hash(tree)
+    if current == await stored_hash():
+        logger.info("Command tree unchanged, skipping sync")
+        return False
+    await sync_commands(tree)
+    return True
@@ -1,57 +1,47 @@
 import discord
 from discord.ext import commands
 import logging
-from database import conn, c
+from commands.utils import MAX_PERSISTENT_NAME_LENGTH, PaginatedView, view_registry, combination_names, insert_combination
+from sound_cache import sound_cache
 
 logger = logging.getLogger(__name__)
 
-available_sounds = {}
 
-async def load_sounds(guild: discord.Guild):
-    """Load all soundboard sounds from the guild"""
-    global available_sounds
-    available_sounds = {}
-    
-    try:
-        # Get soundboard sounds from the guild
-        soundboard_sounds = await guild.fetch_soundboard_sounds()
-        
-        if not soundboard_sounds:
-            logger.warning(f"No soundboard sounds found for guild {guild.name}")
-            return False
-        
-        # Store soundboard sounds by name
-        for sound in soundboard_sounds:
-            available_sounds[sound.name] = sound
-            logger.info(f"Loaded soundboard sound: {sound.name}")
-        
-        logger.info(f"Loaded {len(available_sounds)} soundboard sounds")
-        return True
-    
-    except Exception as e:
-        logger.error(f"Error loading soundboard sounds: {e}")
-        return False
-
-class SoundboardCreateCombinations(discord.ui.View):
+class SoundboardCreateCombinations(PaginatedView):
     """View with buttons for selecting sounds"""
-    
-    def __init__(self, sound_name: str, sound_queues, queue_locks):
-        super().__init__(timeout=None)
+
+    # The picked sounds live in the view, so closing it loses the draft
+    evictable = False
+    evicted_message = ("Your combination draft was closed because too many were open in this server. "
+                       "Run /create_combination again.")
+
+    def __init__(self, sound_name: str, sounds):
+        self.sounds = sounds
         self.sound_name = sound_name
-        self.sound_queues = sound_queues
-        self.queue_locks = queue_locks
-        self.add_sound_buttons()
-        self.add_item(self.save_combination_button())
-
-    def add_sound_buttons(self):
-        for sound_name in list(available_sounds.keys()):  # leave space for Play button
-            button = discord.ui.Button(
-                label=sound_name,
-                style=discord.ButtonStyle.primary,
-                emoji=available_sounds[sound_name].emoji if available_sounds[sound_name].emoji else None,
-            )
-            button.callback = self.add_combination_callback(sound_name)
-            self.add_item(button)
+        self.selected_sounds = []
+        super().__init__(sounds.keys())
+
+    def make_item_button(self, sound_name):
+        button = discord.ui.Button(
+            label=sound_name,
+            style=discord.ButtonStyle.primary,
+            emoji=self.sounds[sound_name].emoji if self.sounds[sound_name].emoji else None,
+        )
+        button.callback = self.add_combination_callback(sound_name)
+        return button
+
+    def control_buttons(self):
+        return [self.save_combination_button()]
+
+    def create_embed(self):
+        embed = discord.Embed(
+            title="🎵 Server Soundboard",
+            description=f"Available sounds: {len(self.sounds)}",
+            color=discord.Color.blue()
+        )
+        for sound_name in self.page_items():
+            embed.add_field(name=" ", value=f"• {sound_name}", inline=False)
+        return embed
 
     def save_combination_button(self):
         button = discord.ui.Button(
@@ -71,15 +61,13 @@ class SoundboardCreateCombinations(discord.ui.View):
         return callback
 
     async def add_to_queue(self, interaction: discord.Interaction, sound_name: str):
-        if sound_name not in available_sounds:
+        if sound_name not in self.sounds:
             await interaction.response.send_message("Sound not found.", ephemeral=True)
             return
 
-        guild = interaction.guild
-        async with self.queue_locks[guild.id]:
-            self.sound_queues[guild.id].append(available_sounds[sound_name])
+        self.selected_sounds.append(self.sounds[sound_name])
 
-        count = len(self.sound_queues[guild.id])
+        count = len(self.selected_sounds)
         await interaction.response.send_message(
             f"**{sound_name}** added to queue → position **{count}**\n"
             f"Queue size: **{count}** sounds",
@@ -88,21 +76,18 @@ class SoundboardCreateCombinations(discord.ui.View):
 
     async def save_combination(self, sound_name: str, interaction: discord.Interaction):
         guild = interaction.guild
-        async with self.queue_locks[guild.id]:
-            try:
-                query = "INSERT INTO sound_combination (server_id, sound_name) VALUES (%s, %s) RETURNING id"
-                c.execute(query, (guild.id, sound_name))
-                id = c.fetchone()[0]
-                for sound in self.sound_queues[guild.id]:
-                    c.execute(
-                        "INSERT INTO sound_combination_sounds (combination_id, sound_id) VALUES (%s, %s)",
-                        (id, sound.id)
-                    )
-                conn.commit()
-            except Exception as e:
-                logger.error(f"Error saving combination to database: {e}")
-                await interaction.response.send_message("Failed to save combination.", ephemeral=True)
-                return
+        try:
+            saved = await insert_combination(guild.id, sound_name, [sound.id for sound in self.selected_sounds])
+        except Exception as e:
+            logger.error(f"Error saving combination to database: {e}")
+            await interaction.response.send_message("Failed to save combination.", ephemeral=True)
+            return
+        if not saved:
+            await interaction.response.send_message(
+                f"❌ A combination with the name **{sound_name}** already exists. Please choose a different name.",
+                ephemeral=True
+            )
+            return
         await interaction.response.send_message(f"Combinations for **{sound_name}** saved!", ephemeral=True)
 
 
@@ -114,28 +99,24 @@ class CreateCombinationCog(commands.Cog):
 
     @discord.app_commands.command(name="create_combination", description="Play a sound in your voice channel")
     @discord.app_commands.describe(sound="Name to create soundbar combination")
-    async def create_combination(self, interaction: discord.Interaction, sound: str):
-        
-        self.bot.sound_queues[interaction.guild.id] = []
-        c.execute("SELECT sound_name FROM sound_combination WHERE server_id = %s AND sound_name = %s", (interaction.guild.id, sound))
-        result = c.fetchone()
-        if result:
+    async def create_combination(self, interaction: discord.Interaction, sound: discord.app_commands.Range[str, 1, MAX_PERSISTENT_NAME_LENGTH]):
+        if not interaction.guild:
             await interaction.response.send_message(
-                f"❌ A combination with the name **{sound}** already exists. Please choose a different name.",
+                "❌ This command can only be used in a server.",
                 ephemeral=True
             )
             return
-        
-        if not interaction.guild:
+
+        if sound in await combination_names(interaction.guild.id):
             await interaction.response.send_message(
-                "❌ This command can only be used in a server.",
+                f"❌ A combination with the name **{sound}** already exists. Please choose a different name.",
                 ephemeral=True
             )
             return
         
-        loaded = await load_sounds(interaction.guild)
+        sounds = await sound_cache.get(interaction.guild)
         
-        if not loaded or not available_sounds:
+        if not sounds:
             await interaction.response.send_message(
                 "❌ No soundboard sounds found in this server!\n\n"
                 "**To add soundboard sounds:**\n"
@@ -147,17 +128,9 @@ class CreateCombinationCog(commands.Cog):
             )
             return
         
-        embed = discord.Embed(
-            title="🎵 Server Soundboard",
-            description=f"Available sounds: {len(available_sounds)}",
-            color=discord.Color.blue()
-        )
-        
-        for sound_name in list(available_sounds.keys()):
-            embed.add_field(name=" ", value=f"• {sound_name}", inline=False)
-        
-        view = SoundboardCreateCombinations(sound, self.bot.sound_queues, self.bot.queue_locks)
-        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+        view = SoundboardCreateCombinations(sound, sounds)
+        view_registry.register(interaction.guild.id, view, interaction)
+        await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
 
 
 async def setup(bot):
@@ -1,51 +1,69 @@
 import discord
 from discord.ext import commands
 import logging
-from database import conn, c
-from commands.utils import fetched_combinations
+from commands.utils import CombinationListView, view_registry, fetched_combinations, combination_names, name_choices, remove_combination
 
 logger = logging.getLogger(__name__)
 
 
-class DeleteCombinationView(discord.ui.View):
-    """View for deleting combinations"""
-    
-    def __init__(self, sound_combinations):
-        super().__init__(timeout=None)
-        self.sound_combinations = sound_combinations
-        self.add_combination_buttons()
-        print("DeleteCombinationView initialized with combinations: ", sound_combinations)
-
-    def add_combination_buttons(self):
-        for sound_name in list(self.sound_combinations.keys()):  # limit to 20 for display
-            button = discord.ui.Button(
+async def delete_combination(interaction: discord.Interaction, sound_name: str):
+    guild = interaction.guild
+    try:
+        deleted = await remove_combination(guild.id, sound_name)
+    except Exception as e:
+        logger.error(f"Error deleting combination from database: {e}")
+        await interaction.response.send_message("Failed to delete combination.", ephemeral=True)
+        return
+    if not deleted:
+        # A name typed into /delete_combination, or a button whose combination is already gone
+        await interaction.response.send_message("Combination not found.", ephemeral=True)
+        return
+    await interaction.response.send_message(f"Combination **{sound_name}** deleted!", ephemeral=True)
+
+
+class DeleteCombinationButton(discord.ui.DynamicItem[discord.ui.Button], template=r"combination:delete:(?P<name>.+)"):
+    """Button deleting a combination, dispatched by custom_id so it outlives its view"""
+
+    def __init__(self, sound_name: str):
+        super().__init__(
+            discord.ui.Button(
                 label=sound_name[:80],
-                style=discord.ButtonStyle.danger
-            )
-            button.callback = self.delete_combination_callback(sound_name)
-            self.add_item(button)
-
-    def delete_combination_callback(self, sound_name: str):
-        async def callback(interaction: discord.Interaction):
-            await self.delete_combination(interaction, sound_name)
-        return callback
-
-    async def delete_combination(self, interaction: discord.Interaction, sound_name: str):
-        guild = interaction.guild
-        try:
-            c.execute(
-                "DELETE FROM sound_combination_sounds WHERE combination_id = (SELECT id FROM sound_combination WHERE server_id = %s AND sound_name = %s)",
-                (guild.id, sound_name)
-            )
-            c.execute(
-                "DELETE FROM sound_combination WHERE server_id = %s AND sound_name = %s",
-                (guild.id, sound_name)
+                style=discord.ButtonStyle.danger,
+                custom_id=f"combination:delete:{sound_name}",
             )
-            conn.commit()
-            await interaction.response.send_message(f"Combination **{sound_name}** deleted!", ephemeral=True)
-        except Exception as e:
-            logger.error(f"Error deleting combination from database: {e}")
-            await interaction.response.send_message("Failed to delete combination.", ephemeral=True)
+        )
+        self.sound_name = sound_name
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["name"])
+
+    async def callback(self, interaction: discord.Interaction):
+        await delete_combination(interaction, self.sound_name)
+
+
+class DeleteCombinationView(CombinationListView):
+    """View for deleting combinations"""
+
+    button_class = DeleteCombinationButton
+    button_style = discord.ButtonStyle.danger
+
+    def __init__(self, sound_combinations):
+        super().__init__(sound_combinations)
+        logger.debug(f"DeleteCombinationView opened with {len(sound_combinations)} combinations")
+
+    async def choose(self, interaction: discord.Interaction, sound_name: str):
+        await delete_combination(interaction, sound_name)
+
+    def create_embed(self):
+        embed = discord.Embed(
+            title="🗑️ Delete Soundboard Combinations",
+            description=f"Total: {len(self.sound_combinations)}",
+            color=discord.Color.red()
+        )
+        for sound_name in self.page_items():
+            embed.add_field(name=" ", value=f"• {sound_name}", inline=False)
+        return embed
 
 
 class DeleteCombinationsCog(commands.Cog):
@@ -55,7 +73,8 @@ class DeleteCombinationsCog(commands.Cog):
         self.bot = bot
 
     @discord.app_commands.command(name="delete_combination", description="Delete a combination for this server")
-    async def delete_combination(self, interaction: discord.Interaction):
+    @discord.app_commands.describe(name="Delete this combination instead of showing the list")
+    async def delete_combination(self, interaction: discord.Interaction, name: str = None):
         if not interaction.guild:
             await interaction.response.send_message(
                 "❌ This command can only be used in a server.",
@@ -63,32 +82,32 @@ class DeleteCombinationsCog(commands.Cog):
             )
             return
         
-        query = "SELECT sound_name FROM sound_combination WHERE server_id = %s"
-        c.execute(query, (interaction.guild.id,))
-        results = c.fetchall()
+        if name is not None:
+            await delete_combination(interaction, name)
+            return
 
-        sound_combinations = fetched_combinations({}, results, c, interaction.guild.id)
+        sound_combinations = await fetched_combinations(interaction.guild.id)
         
-        if not results:
+        if not sound_combinations:
             await interaction.response.send_message(
                 "❌ No soundboard combinations found in this server.",
                 ephemeral=True
             )
             return
         
-        embed = discord.Embed(
-            title="🗑️ Delete Soundboard Combinations",
-            description=f"Total: {len(results)}",
-            color=discord.Color.red()
-        )
-        
-        for row in results:
-            embed.add_field(name=" ", value=f"• {row[0]}", inline=False)
-        
         view = DeleteCombinationView(sound_combinations)
-        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+        view_registry.register(interaction.guild.id, view, interaction)
+        await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
+    @delete_combination.autocomplete("name")
+    async def name_autocomplete(self, interaction: discord.Interaction, current: str):
+        if not interaction.guild:
+            return []
+        return name_choices(await combination_names(interaction.guild.id), current)
 
 
 async def setup(bot):
     """Setup function called by discord.py when loading the cog"""
+    # Re-register the persistent buttons so delete lists sent before a restart keep working
+    bot.add_dynamic_items(DeleteCombinationButton)
     await bot.add_cog(DeleteCombinationsCog(bot))
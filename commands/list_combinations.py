@@ -1,6 +1,6 @@
 import discord
 from discord.ext import commands
-from database import c
+from commands.utils import fetched_combinations
 
 
 class ListCombinationsCog(commands.Cog):
@@ -18,16 +18,11 @@ class ListCombinationsCog(commands.Cog):
             )
             return
         
-        query = "SELECT server_id, sound_name FROM sound_combination WHERE server_id = %s"
-        c.execute(query, (interaction.guild.id,))
-        results = c.fetchall()
+        sound_combinations = await fetched_combinations(interaction.guild.id)
         
         guild_combinations = {}
-        for row in results:
-            server_id, sound_name = row
-            if server_id not in guild_combinations:
-                guild_combinations[server_id] = []
-            guild_combinations[server_id].append(sound_name)
+        if sound_combinations:
+            guild_combinations[interaction.guild.id] = list(sound_combinations)
         
         if not guild_combinations:
             await interaction.response.send_message(
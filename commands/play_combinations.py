@@ -1,68 +1,85 @@
 import discord
 from discord.ext import commands
-import asyncio
-from database import c
-from commands.utils import fetched_combinations
+from commands.utils import CombinationListView, view_registry, fetched_combinations, combination_names, name_choices
+from mixer import COMBINATION_PLAYBACK, Mix, mixer
+
+
+async def play_combination(interaction: discord.Interaction, sound_name: str):
+    guild = interaction.guild
+    players = interaction.client.players
+    if players.closing:
+        await interaction.response.send_message("The bot is restarting, try again in a moment.", ephemeral=True)
+        return
+
+    sound_ids = (await fetched_combinations(guild.id)).get(sound_name)
+    if sound_ids is None:
+        await interaction.response.send_message("Combination not found.", ephemeral=True)
+        return
+
+    sounds = [guild.get_soundboard_sound(sound_id) for sound_id in sound_ids]
+    sounds = [sound for sound in sounds if sound is not None]
+    if not sounds:
+        await interaction.response.send_message("This combination has no sounds left to play.", ephemeral=True)
+        return
+
+    # Queue on the guild's player so combinations never play over each other
+    player = players.get(guild)
+    items = [Mix(sound_name, sounds)] if COMBINATION_PLAYBACK == "mixed" else sounds
+    if player.depth + len(items) > players.max_queue_size:
+        await interaction.response.send_message("The queue is full, wait for it to play first.", ephemeral=True)
+        return
+
+    voice_client = await players.connect(interaction)
+    if not voice_client:
+        await interaction.response.send_message(
+            "You must be in a voice channel (or move the bot first).",
+            ephemeral=True
+        )
+        return
 
+    if COMBINATION_PLAYBACK == "mixed":
+        mixer.prepare(sounds)
+    player.enqueue(*items)
+    player.start()
+    await interaction.response.send_message(f"Playing combination ...", ephemeral=True)
 
-class SoundboardCombinationView(discord.ui.View):
-    """View for displaying saved combinations"""
-    
-    def __init__(self, sound_combinations):
-        super().__init__(timeout=None)
-        self.sound_combinations = sound_combinations
-        self.add_sound_buttons()
-
-    def add_sound_buttons(self):
-        for sound_name in list(self.sound_combinations.keys()):  # leave space for Play button
-            button = discord.ui.Button(
+
+class PlayCombinationButton(discord.ui.DynamicItem[discord.ui.Button], template=r"combination:play:(?P<name>.+)"):
+    """Button playing a combination, dispatched by custom_id so it outlives its view"""
+
+    def __init__(self, sound_name: str):
+        super().__init__(
+            discord.ui.Button(
                 label=sound_name[:80],
-                style=discord.ButtonStyle.primary
+                style=discord.ButtonStyle.primary,
+                custom_id=f"combination:play:{sound_name}",
             )
-            button.callback = self.play_sound_callback(sound_name)
-            self.add_item(button)
-    
-    def play_sound_callback(self, sound_name: str):
-        async def callback(interaction: discord.Interaction):
-            await self.play_sound(interaction, self.sound_combinations[sound_name])
-        return callback
-
-    async def play_sound(self, interaction: discord.Interaction, sound_ids: list):
-        guild = interaction.guild
-
-        if not guild.voice_client:
-            if interaction.user.voice:
-                await interaction.user.voice.channel.connect()
-            else:
-                await interaction.response.send_message(
-                    "You must be in a voice channel (or move the bot first).",
-                    ephemeral=True
-                )
-                return
-
-        voice_client = guild.voice_client
-
-        if not voice_client.channel:
-            await interaction.response.send_message("Bot is not in a voice channel.", ephemeral=True)
-            return
+        )
+        self.sound_name = sound_name
 
-        # Acknowledge immediately
-        await interaction.response.send_message(f"Playing combination ...", ephemeral=True)
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["name"])
 
-        for sound_id in sound_ids:
-            try:
-                sound = guild.get_soundboard_sound(sound_id)
-                await voice_client.channel.send_sound(sound)
+    async def callback(self, interaction: discord.Interaction):
+        await play_combination(interaction, self.sound_name)
 
-                # Wait until it's finished (soundboard sounds are short, but still)
-                await asyncio.sleep(3.5)  # ← adjust based on average sound length
 
-            except Exception as e:
-                print(f"Error playing soundboard sound: {e}")
-                break
-        
-        # Disconnect from voice channel after all sounds are played
-        await voice_client.disconnect()
+class SoundboardCombinationView(CombinationListView):
+    """View for displaying saved combinations"""
+
+    button_class = PlayCombinationButton
+    button_style = discord.ButtonStyle.primary
+
+    async def choose(self, interaction: discord.Interaction, sound_name: str):
+        await play_combination(interaction, sound_name)
+
+    def create_embed(self):
+        return discord.Embed(
+            title="🎵 Combinations soundboard",
+            description=f"Available sounds: {len(self.sound_combinations)}",
+            color=discord.Color.blue()
+        )
 
 
 class PlayCombinationsCog(commands.Cog):
@@ -72,7 +89,8 @@ class PlayCombinationsCog(commands.Cog):
         self.bot = bot
 
     @discord.app_commands.command(name="play_created_combinations", description="Play createdcombinations for this server")
-    async def play_created_combinations(self, interaction: discord.Interaction):
+    @discord.app_commands.describe(name="Play this combination instead of showing the list")
+    async def play_created_combinations(self, interaction: discord.Interaction, name: str = None):
         if not interaction.guild:
             await interaction.response.send_message(
                 "❌ This command can only be used in a server.",
@@ -80,11 +98,11 @@ class PlayCombinationsCog(commands.Cog):
             )
             return
         
-        query = "SELECT sound_name FROM sound_combination WHERE server_id = %s"
-        c.execute(query, (interaction.guild.id,))
-        results = c.fetchall()
+        if name is not None:
+            await play_combination(interaction, name)
+            return
 
-        sound_combinations = fetched_combinations({}, results, c, interaction.guild.id)
+        sound_combinations = await fetched_combinations(interaction.guild.id)
 
         if not sound_combinations:
             await interaction.response.send_message(
@@ -93,16 +111,19 @@ class PlayCombinationsCog(commands.Cog):
             )
             return
         
-        embed = discord.Embed(
-            title="🎵 Combinations soundboard",
-            description=f"Available sounds: {len(sound_combinations)}",
-            color=discord.Color.blue()
-        )
-
         view = SoundboardCombinationView(sound_combinations)
-        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+        view_registry.register(interaction.guild.id, view, interaction)
+        await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
+    @play_created_combinations.autocomplete("name")
+    async def name_autocomplete(self, interaction: discord.Interaction, current: str):
+        if not interaction.guild:
+            return []
+        return name_choices(await combination_names(interaction.guild.id), current)
 
 
 async def setup(bot):
     """Setup function called by discord.py when loading the cog"""
+    # Re-register the persistent buttons so combination lists sent before a restart keep working
+    bot.add_dynamic_items(PlayCombinationButton)
     await bot.add_cog(PlayCombinationsCog(bot))
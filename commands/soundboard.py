@@ -1,146 +1,126 @@
 import discord
 from discord.ext import commands
 import logging
+import math
+from dispatcher import add_limiter
+from sound_cache import sound_cache
+from commands.utils import PaginatedView, view_registry, name_choices
 
 logger = logging.getLogger(__name__)
 
-available_sounds = {}
-
-async def load_sounds(guild: discord.Guild):
-    """Load all soundboard sounds from the guild"""
-    global available_sounds
-    available_sounds = {}
-    
-    try:
-        # Get soundboard sounds from the guild
-        soundboard_sounds = await guild.fetch_soundboard_sounds()
-        
-        if not soundboard_sounds:
-            logger.warning(f"No soundboard sounds found for guild {guild.name}")
-            return False
-        
-        # Store soundboard sounds by name
-        for sound in soundboard_sounds:
-            available_sounds[sound.name] = sound
-            logger.info(f"Loaded soundboard sound: {sound.name}")
-        
-        logger.info(f"Loaded {len(available_sounds)} soundboard sounds")
-        return True
-    
-    except Exception as e:
-        logger.error(f"Error loading soundboard sounds: {e}")
-        return False
 
+async def add_sound(interaction: discord.Interaction, sound):
+    """Add a sound to the guild's queue, within the user's rate limit and the queue's size"""
+    if sound is None:
+        await interaction.response.send_message("Sound not found.", ephemeral=True)
+        return
+    if interaction.client.players.closing:
+        await interaction.response.send_message("The bot is restarting, try again in a moment.", ephemeral=True)
+        return
 
-class SoundboardView(discord.ui.View):
-    """View with buttons for selecting sounds"""
-    
-    def __init__(self, sound_queues, queue_locks):
-        super().__init__(timeout=None)
-        self.sound_queues = sound_queues
-        self.queue_locks = queue_locks
-        self.add_sound_buttons()
-        self.add_item(self.create_play_queue_button())
-
-    def add_sound_buttons(self):
-        for sound_name in list(available_sounds.keys()):  # leave space for Play button
-            button = discord.ui.Button(
-                label=sound_name,
+    retry_after = add_limiter.try_acquire((interaction.guild.id, interaction.user.id))
+    if retry_after:
+        await interaction.response.send_message(
+            f"You're adding sounds too fast, try again in {math.ceil(retry_after)}s.", ephemeral=True
+        )
+        return
+
+    count = interaction.client.players.get(interaction.guild).enqueue(sound)
+    if count is None:
+        await interaction.response.send_message("The queue is full, wait for it to play first.", ephemeral=True)
+        return
+    await interaction.response.send_message(
+        f"**{sound.name}** added to queue → position **{count}**\n"
+        f"Queue size: **{count}** sounds",
+        ephemeral=True
+    )
+
+
+class SoundButton(discord.ui.DynamicItem[discord.ui.Button], template=r"soundboard:add:(?P<sound_id>[0-9]+)"):
+    """Button adding a sound to the guild's queue, dispatched by custom_id so it outlives its view"""
+
+    def __init__(self, sound_id: int, label: str = None, emoji=None):
+        super().__init__(
+            discord.ui.Button(
+                label=label,
                 style=discord.ButtonStyle.primary,
-                emoji=available_sounds[sound_name].emoji if available_sounds[sound_name].emoji else None,
+                emoji=emoji,
+                custom_id=f"soundboard:add:{sound_id}",
             )
-            button.callback = self.make_add_to_queue_callback(sound_name)
-            self.add_item(button)
-
-    def create_play_queue_button(self):
-        button = discord.ui.Button(
-            label="▶️ Play Queue",
-            style=discord.ButtonStyle.green,
-            row=4  # bottom row
         )
-        button.callback = self.play_queue_callback
-        return button
+        self.sound_id = sound_id
 
-    def make_add_to_queue_callback(self, sound_name: str):
-        async def callback(interaction: discord.Interaction):
-            await self.add_to_queue(interaction, sound_name)
-        return callback
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(int(match["sound_id"]), label=item.label)
 
-    async def add_to_queue(self, interaction: discord.Interaction, sound_name: str):
-        if sound_name not in available_sounds:
-            await interaction.response.send_message("Sound not found.", ephemeral=True)
-            return
+    async def callback(self, interaction: discord.Interaction):
+        await add_sound(interaction, sound_cache.find(interaction.guild, self.sound_id))
 
-        guild = interaction.guild
-        async with self.queue_locks[guild.id]:
-            self.sound_queues[guild.id].append(available_sounds[sound_name])
 
-        count = len(self.sound_queues[guild.id])
-        await interaction.response.send_message(
-            f"**{sound_name}** added to queue → position **{count}**\n"
-            f"Queue size: **{count}** sounds",
-            ephemeral=True
+class PlayQueueButton(discord.ui.DynamicItem[discord.ui.Button], template=r"soundboard:play"):
+    """Button starting the guild's queue, dispatched by custom_id so it outlives its view"""
+
+    def __init__(self):
+        super().__init__(
+            discord.ui.Button(
+                label="▶️ Play Queue",
+                style=discord.ButtonStyle.green,
+                custom_id="soundboard:play",
+                row=4  # bottom row
+            )
         )
 
-    async def play_queue_callback(self, interaction: discord.Interaction):
-        import asyncio
-        
-        guild = interaction.guild
-
-        if not guild.voice_client:
-            if interaction.user.voice:
-                await interaction.user.voice.channel.connect()
-            else:
-                await interaction.response.send_message(
-                    "You must be in a voice channel (or move the bot first).",
-                    ephemeral=True
-                )
-                self.sound_queues.clear()
-                return
-
-        voice_client = guild.voice_client
-
-        if not voice_client.channel:
-            await interaction.response.send_message("Bot is not in a voice channel.", ephemeral=True)
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls()
+
+    async def callback(self, interaction: discord.Interaction):
+        players = interaction.client.players
+        if players.closing:
+            await interaction.response.send_message("The bot is restarting, try again in a moment.", ephemeral=True)
             return
+        player = players.get(interaction.guild)
+
+        voice_client = await players.connect(interaction)
+        if not voice_client:
+            await interaction.response.send_message(
+                "You must be in a voice channel (or move the bot first).",
+                ephemeral=True
+            )
+            player.clear()
+            return
+
+        # Start the guild's player; a second click only reports the running one
+        if player.start():
+            await interaction.response.send_message("Starting queue playback...", ephemeral=True)
+        else:
+            await interaction.response.send_message(
+                f"Queue is already playing → **{player.depth}** sounds left",
+                ephemeral=True
+            )
 
-        # Acknowledge immediately
-        await interaction.response.send_message("Starting queue playback...", ephemeral=True)
 
-        # Start playing in background
-        asyncio.create_task(self.play_queue_in_background(guild, voice_client))
+class SoundboardView(PaginatedView):
+    """View with buttons for selecting sounds"""
+    
+    def __init__(self, sounds):
+        self.sounds = sounds
+        super().__init__(sounds.keys())
 
-    async def play_queue_in_background(self, guild: discord.Guild, voice_client):
-        import asyncio
-        
-        async with self.queue_locks[guild.id]:
-            if not self.sound_queues[guild.id]:
-                return
-
-        while True:
-            async with self.queue_locks[guild.id]:
-                if not self.sound_queues[guild.id]:
-                    break
-                next_sound = self.sound_queues[guild.id].pop(0)
-                print(f"Playing sound {next_sound} from queue for guild {guild.name}")
-
-            try:
-                # Play soundboard sound
-                await voice_client.channel.send_sound(next_sound)
-
-                # Wait until it's finished (soundboard sounds are short, but still)
-                # Unfortunately discord.py doesn't provide direct "is_playing" for soundboard
-                # We can approximate with a delay or listen to voice state (more advanced)
-                await asyncio.sleep(3.5)  # ← adjust based on average sound length
-
-            except Exception as e:
-                print(f"Error playing soundboard sound: {e}")
-                break
-
-        print(f"Queue finished for guild {guild.name}")
-        
-        # Disconnect from voice channel after all sounds are played
-        await voice_client.disconnect()
+    def make_item_button(self, sound_name):
+        sound = self.sounds[sound_name]
+        return SoundButton(sound.id, label=sound_name, emoji=sound.emoji if sound.emoji else None)
+
+    def control_buttons(self):
+        return [PlayQueueButton()]
+
+    def create_embed(self):
+        return discord.Embed(
+            title="🎵 Server Soundboard",
+            description=f"Available sounds: {len(self.sounds)}",
+            color=discord.Color.blue()
+        )
 
 
 class SoundboardCog(commands.Cog):
@@ -150,7 +130,8 @@ class SoundboardCog(commands.Cog):
         self.bot = bot
 
     @discord.app_commands.command(name="soundboard", description="Show the soundboard sounds and add them to a queue and play them")
-    async def soundboard(self, interaction: discord.Interaction):
+    @discord.app_commands.describe(sound="Add this sound to the queue instead of showing the soundboard")
+    async def soundboard(self, interaction: discord.Interaction, sound: str = None):
         """Show the soundboard with available sounds"""
         if not interaction.guild:
             await interaction.response.send_message(
@@ -158,11 +139,16 @@ class SoundboardCog(commands.Cog):
                 ephemeral=True
             )
             return
+
+        sounds = await sound_cache.get(interaction.guild)
+        if sound is not None:
+            # Adds to the running queue, so unlike opening the soundboard it does not reset it
+            await add_sound(interaction, sounds.get(sound))
+            return
+
+        self.bot.players.reset(interaction.guild)
         
-        self.bot.sound_queues[interaction.guild.id] = []
-        loaded = await load_sounds(interaction.guild)
-        
-        if not loaded or not available_sounds:
+        if not sounds:
             await interaction.response.send_message(
                 "❌ No soundboard sounds found in this server!\n\n"
                 "**To add soundboard sounds:**\n"
@@ -174,17 +160,20 @@ class SoundboardCog(commands.Cog):
             )
             return
         
-        embed = discord.Embed(
-            title="🎵 Server Soundboard",
-            description=f"Available sounds: {len(available_sounds)}",
-            color=discord.Color.blue()
-        )
-        
-        view = SoundboardView(self.bot.sound_queues, self.bot.queue_locks)
-        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+        view = SoundboardView(sounds)
+        view_registry.register(interaction.guild.id, view, interaction)
+        await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
+    @soundboard.autocomplete("sound")
+    async def sound_autocomplete(self, interaction: discord.Interaction, current: str):
+        if not interaction.guild:
+            return []
+        return name_choices(await sound_cache.names(interaction.guild), current)
 
 
 async def setup(bot):
     """Setup function called by discord.py when loading the cog"""
+    # Re-register the persistent buttons so soundboards sent before a restart keep working
+    bot.add_dynamic_items(SoundButton, PlayQueueButton)
     await bot.add_cog(SoundboardCog(bot))
 
@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+import discord
+from discord.ext import commands
+import logging
+
+from transfer import export_combinations, import_combinations
+
+logger = logging.getLogger(__name__)
+
+
+def is_owner(interaction: discord.Interaction):
+    return interaction.user.id == int(os.getenv("OWNER_ID", "0"))
+
+
+class TransferCog(commands.Cog):
+    """Owner-only export and import of combinations"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @discord.app_commands.command(name="export_combinations", description="Export combinations as a file Only bot owner")
+    @discord.app_commands.describe(server_id="Only export this server's combinations (default: every server)")
+    async def export_combinations(self, interaction: discord.Interaction, server_id: str = None):
+        if not is_owner(interaction):
+            await interaction.response.send_message('You must be the owner to use this command!', ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+
+        # Stream to a temporary file rather than building the export in memory
+        with tempfile.TemporaryFile("w+b") as dump:
+            try:
+                count = await export_combinations(
+                    lambda line: dump.write(line.encode()), int(server_id) if server_id else None
+                )
+            except Exception as e:
+                logger.error(f"Failed to export combinations: {e}")
+                await interaction.followup.send(f"Failed to export combinations: {e}", ephemeral=True)
+                return
+            dump.seek(0)
+            await interaction.followup.send(
+                f"Exported {count} combination(s)",
+                file=discord.File(dump, filename="combinations.ndjson"),
+                ephemeral=True
+            )
+
+    @discord.app_commands.command(name="import_combinations", description="Import combinations from an export file Only bot owner")
+    @discord.app_commands.describe(
+        file="A file created by /export_combinations or sound_manager.py export",
+        server_id="Import every combination into this server instead of the one it was exported from",
+    )
+    async def import_combinations(self, interaction: discord.Interaction, file: discord.Attachment, server_id: str = None):
+        if not is_owner(interaction):
+            await interaction.response.send_message('You must be the owner to use this command!', ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+
+        with tempfile.TemporaryFile("w+b") as dump:
+            try:
+                await file.save(dump)
+                dump.seek(0)
+                lines = (line.decode() for line in dump)
+                count = await import_combinations(lines, int(server_id) if server_id else None)
+            except Exception as e:
+                logger.error(f"Failed to import combinations: {e}")
+                await interaction.followup.send(f"Failed to import combinations: {e}", ephemeral=True)
+                return
+        await interaction.followup.send(f"Imported {count} combination(s)", ephemeral=True)
+
+
+async def setup(bot):
+    """Setup function called by discord.py when loading the cog"""
+    await bot.add_cog(TransferCog(bot))
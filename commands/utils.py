@@ -1,13 +1,232 @@
-from database import c
-
-def fetched_combinations(sound_combinations, results, c, server_id):
-    """Fetch combination details from database"""
-    for row in results:
-        sound_ids = []
-        query = "SELECT sound_id FROM sound_combination_sounds WHERE combination_id = (SELECT id FROM sound_combination WHERE server_id = %s AND sound_name = %s)"
-        c.execute(query, (server_id, row[0]))
-        sound_combination_ids = c.fetchall()
-        for ids in sound_combination_ids:
-            sound_ids.append(ids[0])
-        sound_combinations[row[0]] = sound_ids
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+
+import discord
+from combination_cache import combination_cache
+from prefix_index import PrefixIndex
+from storage import store
+
+logger = logging.getLogger(__name__)
+
+
+async def fetched_combinations(server_id):
+    """Fetch every combination of a server with its ordered sound ids, served from the cache when possible"""
+    sound_combinations = combination_cache.get(server_id)
+    if sound_combinations is None:
+        # put() drops the result if a write landed while it was being fetched
+        generation = combination_cache.generation(server_id)
+        sound_combinations = await store.list_combinations(server_id)
+        combination_cache.put(server_id, sound_combinations, generation)
     return sound_combinations
+
+
+async def combination_names(server_id):
+    """Prefix index of a server's combination names"""
+    sound_combinations = await fetched_combinations(server_id)
+    names = combination_cache.names(server_id)
+    # A guild too big for the cache gets a throwaway index
+    return names if names is not None else PrefixIndex(sound_combinations)
+
+
+def name_choices(names: PrefixIndex, current: str):
+    """Autocomplete choices for the names starting with what the user has typed"""
+    # Discord rejects choices longer than 100 characters
+    return [discord.app_commands.Choice(name=name, value=name) for name in names.search(current) if len(name) <= 100]
+
+
+async def insert_combination(server_id, sound_name, sound_ids):
+    """Save a combination and its ordered sounds in one transaction; False if the name is taken"""
+    if not await store.create_combination(server_id, sound_name, sound_ids):
+        return False
+    combination_cache.add(server_id, sound_name, sound_ids)
+    return True
+
+
+async def remove_combination(server_id, sound_name):
+    """Delete a combination together with its sounds"""
+    deleted = await store.delete_combination(server_id, sound_name)
+    combination_cache.discard(server_id, sound_name)
+    return deleted
+
+
+# Longest combination name whose buttons can carry it in a 100 character custom_id
+MAX_PERSISTENT_NAME_LENGTH = 80
+
+# Interaction tokens expire after 15 minutes, so an ephemeral view can't be edited after that anyway
+VIEW_TIMEOUT = float(os.getenv("VIEW_TIMEOUT", "900"))
+
+
+class ViewRegistry:
+    """Caps the live views per guild; registering past the cap stops the oldest view.
+
+    Views whose buttons are all persistent only lose their page controls when stopped. Views with
+    buttons of their own (e.g. a combination draft) stop working entirely, so they have a separate
+    cap and tell their user when they are closed.
+    """
+
+    def __init__(self, max_views_per_guild: int, max_drafts_per_guild: int):
+        self.max_views_per_guild = max_views_per_guild
+        self.max_drafts_per_guild = max_drafts_per_guild
+        self._views = {}  # guild id -> OrderedDict of view id -> view, for evictable views
+        self._drafts = {}  # the same for views that hold state outside persistent buttons
+        self._notices = set()  # tasks telling users their view was closed
+
+    def register(self, guild_id: int, view: discord.ui.View, interaction: discord.Interaction = None):
+        """Track a view; `interaction` is the one that sent it, used to tell its user if it is closed"""
+        evictable = getattr(view, "evictable", True)
+        registry, cap = (self._views, self.max_views_per_guild) if evictable else (self._drafts, self.max_drafts_per_guild)
+        views = registry.setdefault(guild_id, OrderedDict())
+        views[id(view)] = view
+        view.registry_guild_id = guild_id
+        view.registry_interaction = interaction
+        while len(views) > cap:
+            _, oldest = views.popitem(last=False)
+            # Stopping removes the view from discord.py's view store; persistent buttons keep working
+            oldest.stop()
+            if not evictable:
+                task = asyncio.create_task(oldest.on_evicted())
+                self._notices.add(task)
+                task.add_done_callback(self._notice_sent)
+
+    def _notice_sent(self, task: asyncio.Task):
+        self._notices.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to tell the user their view was closed: {task.exception()}")
+
+    def unregister(self, view: discord.ui.View):
+        guild_id = getattr(view, "registry_guild_id", None)
+        for registry in (self._views, self._drafts):
+            views = registry.get(guild_id)
+            if views is not None:
+                views.pop(id(view), None)
+                if not views:
+                    del registry[guild_id]
+
+    @property
+    def live_views(self):
+        return sum(len(views) for registry in (self._views, self._drafts) for views in registry.values())
+
+
+view_registry = ViewRegistry(
+    max_views_per_guild=int(os.getenv("VIEW_CAP_PER_GUILD", "5")),
+    max_drafts_per_guild=int(os.getenv("DRAFT_CAP_PER_GUILD", "5")),
+)
+
+
+class PaginatedView(discord.ui.View):
+    """View that builds the buttons of one page of items at a time, with previous/next controls"""
+
+    # Four rows of five buttons; the bottom row holds the page controls and the view's own buttons
+    page_size = 20
+    # False for views whose buttons stop working when the view is stopped, not just the page controls
+    evictable = True
+    evicted_message = "This message was closed because too many were open in this server. Run the command again."
+
+    def __init__(self, items, **kwargs):
+        kwargs.setdefault("timeout", VIEW_TIMEOUT)
+        super().__init__(**kwargs)
+        self.items = list(items)
+        self.page = 0
+        self.render()
+
+    @property
+    def page_count(self):
+        return max(1, -(-len(self.items) // self.page_size))
+
+    async def on_timeout(self):
+        view_registry.unregister(self)
+
+    async def on_evicted(self):
+        """Tell the user the view was closed by the registry"""
+        interaction = getattr(self, "registry_interaction", None)
+        if interaction is None:
+            return
+        try:
+            await interaction.edit_original_response(content=self.evicted_message, embed=None, view=None)
+        except discord.HTTPException as e:
+            logger.warning(f"Could not tell the user their view was closed: {e}")
+
+    def page_items(self):
+        start = self.page * self.page_size
+        return self.items[start:start + self.page_size]
+
+    def make_item_button(self, item):
+        """Return the button for one item of the current page"""
+        raise NotImplementedError
+
+    def control_buttons(self):
+        """Return the view's own buttons for the bottom row (at most three)"""
+        return []
+
+    def create_embed(self):
+        """Return the embed describing the current page, or None for no embed"""
+        return None
+
+    def build_embed(self):
+        embed = self.create_embed()
+        if embed is not None and self.page_count > 1:
+            embed.set_footer(text=f"Page {self.page + 1}/{self.page_count}")
+        return embed
+
+    def render(self):
+        self.clear_items()
+        for item in self.page_items():
+            self.add_item(self.make_item_button(item))
+
+        if self.page_count > 1:
+            previous_button = discord.ui.Button(label="◀️", style=discord.ButtonStyle.secondary, row=4)
+            previous_button.callback = self.previous_page
+            self.add_item(previous_button)
+            next_button = discord.ui.Button(label="▶️", style=discord.ButtonStyle.secondary, row=4)
+            next_button.callback = self.next_page
+            self.add_item(next_button)
+
+        for button in self.control_buttons():
+            button.row = 4
+            self.add_item(button)
+
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        self.page = page % self.page_count
+        self.render()
+        embed = self.build_embed()
+        if embed is None:
+            await interaction.response.edit_message(view=self)
+        else:
+            await interaction.response.edit_message(embed=embed, view=self)
+
+    async def previous_page(self, interaction: discord.Interaction):
+        await self.show_page(interaction, self.page - 1)
+
+    async def next_page(self, interaction: discord.Interaction):
+        await self.show_page(interaction, self.page + 1)
+
+
+class CombinationListView(PaginatedView):
+    """One button per combination name; subclasses set the persistent button and the action"""
+
+    # DynamicItem taking a combination name, and the style of the fallback button matching it
+    button_class = None
+    button_style = discord.ButtonStyle.primary
+
+    def __init__(self, sound_combinations):
+        self.sound_combinations = sound_combinations
+        # Names from before the length limit don't fit in a custom_id, so their buttons die with the
+        # view; a view holding any of them must not be evicted silently
+        self.evictable = all(len(name) <= MAX_PERSISTENT_NAME_LENGTH for name in sound_combinations)
+        super().__init__(sound_combinations.keys())
+
+    async def choose(self, interaction: discord.Interaction, sound_name: str):
+        """Run the view's action on a combination"""
+        raise NotImplementedError
+
+    def make_item_button(self, sound_name):
+        if len(sound_name) <= MAX_PERSISTENT_NAME_LENGTH:
+            return self.button_class(sound_name)
+
+        button = discord.ui.Button(label=sound_name[:80], style=self.button_style)
+        async def callback(interaction: discord.Interaction):
+            await self.choose(interaction, sound_name)
+        button.callback = callback
+        return button
@@ -1,15 +1,68 @@
-import psycopg2
 import os
-from dotenv import load_dotenv
+import logging
+from psycopg_pool import AsyncConnectionPool
 
-# Load environment variables
-load_dotenv()
+from instrumentation import db_query_seconds, statement_label, timed
 
-# Database connection
-conn = psycopg2.connect(
-    host=os.getenv("DB_HOST"),
-    database=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD")
+logger = logging.getLogger(__name__)
+
+
+def _reconnect_failed(pool):
+    logger.error(f"Database pool {pool.name} could not reconnect, will keep retrying on demand")
+
+
+# Database connection pool. Connections are only opened by open_pool(),
+# so importing this module never touches the network. The DB_* settings are
+# read from the environment, which the entry point (main.py) loads first.
+pool = AsyncConnectionPool(
+    kwargs={
+        "host": os.getenv("DB_HOST"),
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+    },
+    min_size=int(os.getenv("DB_POOL_MIN", "1")),
+    max_size=int(os.getenv("DB_POOL_MAX", "10")),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+    reconnect_timeout=float(os.getenv("DB_POOL_RECONNECT_TIMEOUT", "60")),
+    reconnect_failed=_reconnect_failed,
+    check=AsyncConnectionPool.check_connection,
+    name="soundboard",
+    open=False,
 )
-c = conn.cursor()
+
+
+async def open_pool():
+    """Open the pool and wait until min_size connections are ready"""
+    await pool.open(wait=True)
+    logger.info(f"Database pool ready ({pool.min_size}-{pool.max_size} connections)")
+
+
+async def close_pool():
+    """Close every connection held by the pool"""
+    await pool.close()
+
+
+async def execute(query, params=()):
+    """Run a statement in its own transaction and return the affected row count"""
+    with timed(db_query_seconds, statement=statement_label(query)):
+        async with pool.connection() as conn:
+            cur = await conn.execute(query, params)
+            return cur.rowcount
+
+
+async def fetchone(query, params=()):
+    """Run a query and return the first row (or None)"""
+    with timed(db_query_seconds, statement=statement_label(query)):
+        async with pool.connection() as conn:
+            cur = await conn.execute(query, params)
+            return await cur.fetchone()
+
+
+async def fetchall(query, params=()):
+    """Run a query and return all rows"""
+    with timed(db_query_seconds, statement=statement_label(query)):
+        async with pool.connection() as conn:
+            cur = await conn.execute(query, params)
+            return await cur.fetchall()
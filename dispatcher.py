@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import random
+
+import aiohttp
+import discord
+
+from instrumentation import guild_bucket, send_sound_retries, send_sound_seconds, timed
+from ratelimit import KeyedRateLimiter, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class SoundDispatcher:
+    """Sends every soundboard sound through a global and a per-guild token bucket, retrying 429s and outages"""
+
+    def __init__(self, global_rate: float, global_burst: float, guild_rate: float, guild_burst: float,
+                 max_retries: int = 3, base_backoff: float = 0.5):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.guild_rate = guild_rate
+        self.guild_burst = guild_burst
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self._guild_buckets = {}  # guild id -> TokenBucket
+        self._prune_at = 1000
+
+    def _guild_bucket(self, guild):
+        bucket = self._guild_buckets.get(guild.id)
+        if bucket is None:
+            # Drop buckets that have refilled completely; they behave exactly like new ones
+            if len(self._guild_buckets) >= self._prune_at:
+                self._guild_buckets = {key: value for key, value in self._guild_buckets.items() if not value.full}
+                self._prune_at = max(1000, 2 * len(self._guild_buckets))
+            bucket = self._guild_buckets[guild.id] = TokenBucket(self.guild_rate, self.guild_burst)
+        return bucket
+
+    def _backoff(self, attempt: int):
+        # Full jitter so guilds that failed together don't retry together
+        return random.uniform(0, self.base_backoff * 2 ** attempt)
+
+    async def send(self, channel, sound):
+        """Send the sound to the voice channel; re-raises the last error once retries are exhausted"""
+        guild = channel.guild
+        bucket = self._guild_bucket(guild)
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                with timed(send_sound_seconds, guild_bucket=guild_bucket(guild)):
+                    return await channel.send_sound(sound)
+            except discord.RateLimited as e:
+                # discord.py waits out short rate limits itself and only raises for long ones, never global ones
+                error, reason, retry_after = e, "rate_limited", e.retry_after
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    reason = "global_rate_limited" if _is_global(e) else "rate_limited"
+                    error, retry_after = e, _retry_after(e)
+                elif e.status >= 500:
+                    error, reason, retry_after = e, "server_error", self._backoff(attempt)
+                else:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error, reason, retry_after = e, "connection_error", self._backoff(attempt)
+
+            if attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            send_sound_retries.inc(reason=reason)
+            logger.warning(f"send_sound in guild {guild.id} failed ({reason}), retry {attempt} in {retry_after:.2f}s")
+            # Pausing the guild's bucket also holds back any other send to that guild until the retry
+            bucket.pause(retry_after)
+            if reason == "global_rate_limited":
+                # The whole bot is limited, so hold back every guild, not just this one
+                self.global_bucket.pause(retry_after)
+
+
+def _is_global(error: discord.HTTPException):
+    try:
+        headers = error.response.headers
+    except AttributeError:
+        return False
+    return (headers.get("X-RateLimit-Global", "").lower() == "true"
+            or headers.get("X-RateLimit-Scope", "").lower() == "global")
+
+
+def _retry_after(error: discord.HTTPException):
+    try:
+        return float(error.response.headers.get("Retry-After", 1))
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
+
+
+def create_dispatcher():
+    return SoundDispatcher(
+        global_rate=float(os.getenv("SEND_RATE_GLOBAL", "40")),
+        global_burst=float(os.getenv("SEND_BURST_GLOBAL", "40")),
+        guild_rate=float(os.getenv("SEND_RATE_GUILD", "2")),
+        guild_burst=float(os.getenv("SEND_BURST_GUILD", "5")),
+        max_retries=int(os.getenv("SEND_MAX_RETRIES", "3")),
+    )
+
+
+# Limits how fast a single user can add sounds to a queue with the soundboard buttons
+add_limiter = KeyedRateLimiter(
+    rate=float(os.getenv("ADD_RATE_PER_USER", "1")),
+    burst=float(os.getenv("ADD_BURST_PER_USER", "5")),
+)
@@ -0,0 +1,102 @@
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import discord
+from discord import app_commands
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Operations slower than this are logged with their labels; 0 turns the slow log off
+SLOW_OPERATION_SECONDS = float(os.getenv("SLOW_OPERATION_MS", "500")) / 1000
+
+command_seconds = registry.histogram(
+    "soundboard_command_duration_seconds", "App command handler latency",
+    labelnames=("command", "guild_bucket", "outcome"),
+)
+db_query_seconds = registry.histogram(
+    "soundboard_db_query_duration_seconds", "Database statement latency, including waiting for a connection",
+    labelnames=("statement",),
+)
+fetch_sounds_seconds = registry.histogram(
+    "soundboard_fetch_soundboard_sounds_duration_seconds", "guild.fetch_soundboard_sounds() latency",
+    labelnames=("guild_bucket",),
+)
+send_sound_seconds = registry.histogram(
+    "soundboard_send_sound_duration_seconds", "channel.send_sound() latency",
+    labelnames=("guild_bucket",),
+)
+send_sound_retries = registry.counter(
+    "soundboard_send_sound_retries_total", "channel.send_sound() calls retried after a rate limit or failure",
+    labelnames=("reason",),
+)
+
+
+def guild_bucket(guild):
+    """Coarse guild size label; keeps label cardinality low while separating big guilds"""
+    if guild is None:
+        return "none"
+    members = guild.member_count or 0
+    if members < 100:
+        return "small"
+    if members < 1000:
+        return "medium"
+    if members < 10000:
+        return "large"
+    return "huge"
+
+
+@lru_cache(maxsize=256)
+def statement_label(query: str):
+    """Label a SQL statement by its verb and first table, e.g. 'select sound_combination'"""
+    verb = query.split(None, 1)[0].lower()
+    match = re.search(r"\b(?:from|into|update)\s+([a-z_]+)", query, re.IGNORECASE)
+    return f"{verb} {match.group(1).lower()}" if match else verb
+
+
+def observe(histogram, elapsed: float, **labels):
+    histogram.observe(elapsed, **labels)
+    if SLOW_OPERATION_SECONDS and elapsed >= SLOW_OPERATION_SECONDS:
+        logger.warning(f"Slow operation {histogram.name} {labels} took {elapsed * 1000:.0f} ms")
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Record how long the block takes in the histogram, exceptions included"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(histogram, time.perf_counter() - started, **labels)
+
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    """Command tree that records how long every app command takes"""
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        interaction.extras["started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        _observe_command(interaction, interaction.command, "error")
+        await super().on_error(interaction, error)
+
+
+def _observe_command(interaction: discord.Interaction, command, outcome: str):
+    started = interaction.extras.get("started")
+    if started is None or command is None:
+        return
+    observe(
+        command_seconds, time.perf_counter() - started,
+        command=command.qualified_name, guild_bucket=guild_bucket(interaction.guild), outcome=outcome,
+    )
+
+
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    """Listener recording successful app commands; added to the bot in main.py"""
+    _observe_command(interaction, command, "ok")
@@ -1,14 +1,144 @@
-from flask import Flask
-from threading import Thread
-app = Flask('')
+import asyncio
+import logging
+import math
+import os
+import time
 
-@app.route('/')
-def home():
-    return "I'm alive!"
+from aiohttp import web
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
+from combination_cache import combination_cache
+from commands.utils import view_registry
+from metrics import registry
+from sound_cache import sound_cache
+from storage import store
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a task that sleeps for a fixed interval"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+
+
+loop_lag = LoopLagMonitor()
+
+
+def register_bot_metrics(bot):
+    """Expose the bot's runtime state as gauges read at scrape time"""
+    registry.gauge("soundboard_gateway_latency_seconds", "Discord gateway heartbeat latency",
+                   lambda: _gateway_latency(bot) or 0.0)
+    registry.gauge("soundboard_event_loop_lag_seconds", "Last measured event loop lag", lambda: loop_lag.lag)
+    registry.gauge("soundboard_event_loop_lag_max_seconds", "Highest event loop lag since start", lambda: loop_lag.max_lag)
+    registry.gauge("soundboard_guilds", "Guilds the bot is in", lambda: len(bot.guilds))
+    registry.gauge("soundboard_db_pool_connections", "Database pool connections by state", _pool_connections,
+                   labelnames=("state",))
+    registry.gauge("soundboard_db_pool_requests_waiting", "Requests waiting for a database connection",
+                   lambda: store.pool_stats().get("requests_waiting", 0))
+    registry.gauge("soundboard_players_active", "Guild players currently running",
+                   lambda: bot.players.active_count)
+    registry.gauge("soundboard_players_queued_sounds", "Sounds waiting in all guild queues",
+                   lambda: bot.players.queued_count)
+    registry.gauge("soundboard_voice_idle_connections", "Voice connections kept open while idle",
+                   lambda: bot.voice_sessions.idle_count)
+    registry.gauge("soundboard_live_views", "Views currently tracked by the view registry",
+                   lambda: view_registry.live_views)
+    registry.gauge("soundboard_sound_cache_guilds", "Guilds held in the soundboard sound cache",
+                   lambda: len(sound_cache))
+    registry.gauge("soundboard_combination_cache", "Combination cache statistics", _combination_cache_stats,
+                   labelnames=("stat",))
+
+
+def _gateway_latency(bot):
+    # NaN until the first heartbeat has been acknowledged
+    return None if math.isnan(bot.latency) else bot.latency
+
+
+def _pool_connections():
+    stats = store.pool_stats()
+    return {
+        ("size",): stats.get("pool_size", 0),
+        ("available",): stats.get("pool_available", 0),
+        ("max",): stats.get("pool_max", 0),
+    }
+
+
+def _combination_cache_stats():
+    return {(name,): value for name, value in combination_cache.stats().items()}
+
+
+def health(bot):
+    """Return (healthy, details) describing whether the bot can serve interactions"""
+    latency = _gateway_latency(bot)
+    pool_stats = store.pool_stats()
+    max_lag = float(os.getenv("HEALTH_MAX_LOOP_LAG", "1.0"))
+    details = {
+        "ready": bot.is_ready(),
+        "shutting_down": bot.players.closing,
+        "gateway_latency_ms": round(latency * 1000, 1) if latency is not None else None,
+        "event_loop_lag_ms": round(loop_lag.lag * 1000, 1),
+        "db_pool": {
+            "open": store.is_open,
+            "size": pool_stats.get("pool_size", 0),
+            "available": pool_stats.get("pool_available", 0),
+            "max": pool_stats.get("pool_max", 0),
+            "requests_waiting": pool_stats.get("requests_waiting", 0),
+        },
+    }
+    healthy = (details["ready"] and not details["shutting_down"] and details["db_pool"]["open"]
+               and loop_lag.lag < max_lag)
+    details["status"] = "ok" if healthy else "unavailable"
+    return healthy, details
+
+
+async def start_health_server(bot):
+    """Serve /healthz and /metrics from the bot's own event loop; returns the runner to clean up"""
+    async def home(request):
+        return web.Response(text="I'm alive!")
+
+    async def healthz(request):
+        healthy, details = health(bot)
+        return web.json_response(details, status=200 if healthy else 503)
+
+    async def metrics(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics)
+
+    register_bot_metrics(bot)
+    loop_lag.start()
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = int(os.getenv("PORT", "8080"))
+    await web.TCPSite(runner, host="0.0.0.0", port=port).start()
+    logger.info(f"Health server listening on port {port}")
+    return runner
+
+
+async def stop_health_server(runner):
+    loop_lag.stop()
+    await runner.cleanup()
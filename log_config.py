@@ -0,0 +1,114 @@
+"""
+Logging that never blocks the event loop: records are put on a queue and a background thread
+formats and writes them, as one JSON object per line by default (LOG_FORMAT=text for plain lines).
+
+Every call site below ERROR is capped at LOG_RATE_PER_SITE records per second, so a log line on
+a hot path can't flood the output; the next record let through says how many were dropped.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+from ratelimit import KeyedRateLimiter
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain lines, ending in "(+N suppressed)" when the rate limit dropped records from the call site"""
+
+    def formatMessage(self, record: logging.LogRecord):
+        # The line before any traceback
+        line = super().formatMessage(record)
+        if getattr(record, "suppressed", 0):
+            line += f" (+{record.suppressed} suppressed)"
+        return line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord):
+        # Resolve the message and traceback now, while the arguments are still current, but keep the
+        # traceback out of the message so the JSON output has it as its own field
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """Drops records past `rate` per second (bursts of `burst`) from any one call site; errors always pass"""
+
+    def __init__(self, rate: float, burst: float):
+        super().__init__()
+        self._limiter = KeyedRateLimiter(rate, burst)
+        self._suppressed = {}  # call site -> records dropped since the last one let through
+
+    def filter(self, record: logging.LogRecord):
+        if record.levelno >= logging.ERROR:
+            return True
+        site = (record.pathname, record.lineno)
+        if self._limiter.try_acquire(site):
+            self._suppressed[site] = self._suppressed.get(site, 0) + 1
+            return False
+        record.suppressed = self._suppressed.pop(site, 0)
+        return True
+
+
+def setup_logging():
+    """Route the root logger through a queue to a background writer thread; safe to call twice"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        handler.setFormatter(TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        handler.setFormatter(JsonFormatter())
+    rate = float(os.getenv("LOG_RATE_PER_SITE", "10"))
+    if rate > 0:
+        # Applied on the writer thread, so the limiter needs no locking
+        handler.addFilter(RateLimitFilter(rate, burst=rate * 2))
+
+    # Unbounded so logging never waits on a slow stderr; the writer drains it in the background
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(_QueueHandler(records))
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_listener.stop)
+    return _listener
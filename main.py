@@ -4,77 +4,155 @@ import os
 import asyncio
 from dotenv import load_dotenv
 import logging
-from collections import defaultdict
+import time
 from pathlib import Path
 
-from keep_alive import keep_alive
-
-sound_queues = defaultdict(list)
-queue_locks  = defaultdict(asyncio.Lock)
-
-# Load environment variables
+# Load environment variables before the modules below read their settings
 load_dotenv()
 
-keep_alive() 
+import command_sync
+from log_config import setup_logging
+from dispatcher import create_dispatcher
+from keep_alive import start_health_server, stop_health_server
+from instrumentation import InstrumentedCommandTree, on_app_command_completion
+from playback import PlaybackManager
+from shutdown import ShutdownCoordinator, restore_queues
+from sound_cache import sound_cache, on_guild_remove, on_soundboard_sound_create, on_soundboard_sound_update, on_soundboard_sound_delete
+from sound_metadata import sound_metadata
+from storage import store
+from voice_sessions import VoiceSessionManager
+
 # Setup logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# Bot setup
-intents = discord.Intents.default()
-intents.voice_states = True
-intents.guilds = True
+def create_bot(shard_ids=None, shard_count=None):
+    """Create the bot; sharded when a shard count is given or SHARD_COUNT is set"""
+    intents = discord.Intents.default()
+    intents.voice_states = True
+    intents.guilds = True
+
+    if shard_count is None and os.getenv("SHARD_COUNT"):
+        # "auto" lets Discord recommend the shard count
+        shard_count = None if os.getenv("SHARD_COUNT") == "auto" else int(os.getenv("SHARD_COUNT"))
+        sharded = True
+    else:
+        sharded = shard_count is not None
+
+    if sharded:
+        bot = commands.AutoShardedBot(
+            command_prefix="/", intents=intents, tree_cls=InstrumentedCommandTree,
+            shard_ids=shard_ids, shard_count=shard_count,
+        )
+    else:
+        bot = commands.Bot(command_prefix="/", intents=intents, tree_cls=InstrumentedCommandTree)
+    bot.add_listener(on_app_command_completion)
+    bot.tree.add_command(sync)
 
-bot = commands.Bot(command_prefix="/", intents=intents)
+    @bot.event
+    async def setup_hook():
+        # Only one process syncs; in cluster mode that is the worker running shard 0
+        if os.getenv("CLUSTER_WORKER", "0") != "0":
+            return
+        try:
+            await command_sync.sync_if_changed(bot.tree)
+        except Exception as e:
+            logger.error(f"Failed to sync commands on startup: {e}")
+
+    @bot.event
+    async def on_ready():
+        logger.info(f"{bot.user} has connected to Discord!")
+        # on_ready fires again after reconnects; the gateway events keep the cache current after the first
+        if not bot.prewarmed:
+            bot.prewarmed = True
+            await prewarm(bot)
+            try:
+                await restore_queues(bot)
+            except Exception as e:
+                logger.error(f"Failed to restore saved queues: {e}")
 
-# Attach shared data to bot for access in cogs
-bot.sound_queues = sound_queues
-bot.queue_locks = queue_locks
+    for listener in (on_soundboard_sound_create, on_soundboard_sound_update, on_soundboard_sound_delete, on_guild_remove):
+        bot.add_listener(listener)
+    bot.prewarmed = False
 
-async def load_cogs():
-    """Load all cogs from the commands directory"""
+    # Attach shared data to bot for access in cogs
+    bot.voice_sessions = VoiceSessionManager(
+        idle_timeout=float(os.getenv("VOICE_IDLE_TIMEOUT", "120")),
+        max_idle=int(os.getenv("VOICE_MAX_IDLE", "50")),
+    )
+    bot.players = PlaybackManager(
+        bot.voice_sessions,
+        create_dispatcher(),
+        idle_timeout=float(os.getenv("PLAYER_IDLE_TIMEOUT", "30")),
+        max_queue_size=int(os.getenv("MAX_QUEUE_SIZE", "50")),
+    )
+    return bot
+
+async def prewarm(bot):
+    """Cache every guild's sounds and their stored durations so first interactions are not cold"""
+    started = time.perf_counter()
+    try:
+        guilds = await sound_cache.prewarm(bot.guilds, concurrency=int(os.getenv("PREWARM_CONCURRENCY", "10")))
+        await sound_metadata.preload(sound_cache.sound_ids())
+        logger.info(f"Prewarmed sounds of {guilds} guild(s) in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        logger.error(f"Failed to prewarm caches: {e}")
+
+async def load_cogs(bot):
+    """Load all cogs from the commands directory concurrently"""
     cogs_dir = Path("commands")
-    for cog_file in cogs_dir.glob("*.py"):
-        if cog_file.name.startswith("_") or cog_file.name == "utils.py":
-            continue
-        cog_name = cog_file.stem
+    cog_names = [
+        cog_file.stem for cog_file in sorted(cogs_dir.glob("*.py"))
+        if not cog_file.name.startswith("_") and cog_file.name != "utils.py"
+    ]
+
+    async def load(cog_name):
         try:
             await bot.load_extension(f"commands.{cog_name}")
             logger.info(f"Loaded cog: {cog_name}")
         except Exception as e:
             logger.error(f"Failed to load cog {cog_name}: {e}")
 
-@bot.tree.command(name="sync", description="Sync slash commands with Discord Only bot owner")
+    await asyncio.gather(*(load(cog_name) for cog_name in cog_names))
+
+@discord.app_commands.command(name="sync", description="Sync slash commands with Discord Only bot owner")
 async def sync(interaction: discord.Interaction):
     """Sync slash commands with Discord"""
     await interaction.response.defer()
     try:
         if interaction.user.id == int(os.getenv("OWNER_ID")):
-            synced = await bot.tree.sync()
+            synced = await command_sync.sync_commands(interaction.client.tree)
             await interaction.followup.send(f"Synced {len(synced)} command(s)")
-            logger.info(f"Synced {len(synced)} command(s)")
         else:
             await interaction.response.send_message('You must be the owner to use this command!')
     except Exception as e:
         await interaction.followup.send(f"Failed to sync commands: {e}")
         logger.error(f"Failed to sync commands: {e}")
 
-@bot.event
-async def on_ready():
-    logger.info(f"{bot.user} has connected to Discord!")
-
 
 # ============= Run the bot =============
-async def main():
+async def run_bot(shard_ids=None, shard_count=None):
+    """Run one bot process; in cluster mode it only connects the given shards"""
+    bot = create_bot(shard_ids, shard_count)
+    ShutdownCoordinator(bot, drain_timeout=float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "5"))).install()
     async with bot:
-        await load_cogs()
+        await load_cogs(bot)
         token = os.getenv("DISCORD_TOKEN")
         if not token:
             raise ValueError(
                 "DISCORD_TOKEN not found in .env file. "
                 "Please add your bot token to the .env file."
             )
-        await bot.start(token)
+        health_server = await start_health_server(bot)
+        try:
+            await store.open()
+            await bot.start(token)
+        finally:
+            await stop_health_server(health_server)
+            await store.close()
+
+async def main():
+    await run_bot()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,119 @@
+"""
+Minimal in-process metrics registry rendered in the Prometheus text format
+"""
+
+from bisect import bisect_left
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonically increasing value per label set"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name + _format_labels(self.labelnames, key), value
+
+
+class Gauge:
+    """Value read from a callback at scrape time; the callback returns a number or {label values: number}"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, callback, labelnames=()):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.callback()
+        if not self.labelnames:
+            yield self.name, value
+            return
+        for key, item in value.items():
+            yield self.name + _format_labels(self.labelnames, key), item
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values per label set"""
+
+    type = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        counts = self._values.get(key)
+        if counts is None:
+            counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        # Only the first matching bucket is incremented; samples() accumulates at scrape time
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for key, counts in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (bound,))
+                yield f"{self.name}_bucket{labels}", cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels}", counts[-1]
+            yield f"{self.name}_count{labels}", cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, help: str, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, callback, labelnames=()):
+        return self._register(Gauge(name, help, callback, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        # Re-registering (e.g. a reloaded cog) replaces the old metric instead of duplicating it
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
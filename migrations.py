@@ -0,0 +1,187 @@
+import logging
+
+from database import pool
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the advisory lock that serialises concurrent migrators
+MIGRATION_LOCK_ID = 4242001
+
+# Numbers the sounds of combinations whose sounds all share position 0, i.e. were saved before
+# positions existed, in the order they were inserted
+BACKFILL_POSITIONS = """
+        UPDATE sound_combination_sounds scs
+        SET position = numbered.rn - 1
+        FROM (
+            SELECT ctid, row_number() OVER (PARTITION BY combination_id ORDER BY ctid) AS rn
+            FROM sound_combination_sounds
+            WHERE combination_id IN (
+                SELECT combination_id FROM sound_combination_sounds
+                GROUP BY combination_id HAVING COUNT(*) > 1 AND MAX(position) = 0
+            )
+        ) numbered
+        WHERE scs.ctid = numbered.ctid
+        """
+
+# (version, description, statements). Append new migrations; never edit applied ones.
+MIGRATIONS = [
+    (1, "create combination tables", [
+        """
+        CREATE TABLE IF NOT EXISTS sound_combination (
+            id SERIAL PRIMARY KEY,
+            server_id BIGINT NOT NULL,
+            sound_name TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sound_combination_sounds (
+            combination_id INTEGER NOT NULL REFERENCES sound_combination (id),
+            sound_id BIGINT NOT NULL
+        )
+        """,
+    ]),
+    (2, "add playback position to combination sounds", [
+        "ALTER TABLE sound_combination_sounds ADD COLUMN IF NOT EXISTS position INTEGER NOT NULL DEFAULT 0",
+    ]),
+    (3, "create sound metadata table", [
+        "CREATE TABLE IF NOT EXISTS sound_metadata (sound_id BIGINT PRIMARY KEY, duration REAL NOT NULL)",
+    ]),
+    (4, "unique combination names, combination_id index and cascading deletes", [
+        """
+        DO $$
+        DECLARE fk record;
+        BEGIN
+            FOR fk IN
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = 'sound_combination_sounds'::regclass AND contype = 'f'
+            LOOP
+                EXECUTE format('ALTER TABLE sound_combination_sounds DROP CONSTRAINT %I', fk.conname);
+            END LOOP;
+        END $$
+        """,
+        # Databases created before this migration may hold duplicate names and orphaned sounds
+        """
+        DELETE FROM sound_combination a
+        USING sound_combination b
+        WHERE a.server_id = b.server_id AND a.sound_name = b.sound_name AND a.id > b.id
+        """,
+        "DELETE FROM sound_combination_sounds WHERE combination_id NOT IN (SELECT id FROM sound_combination)",
+        """
+        ALTER TABLE sound_combination_sounds
+            ADD CONSTRAINT sound_combination_sounds_combination_id_fkey
+            FOREIGN KEY (combination_id) REFERENCES sound_combination (id) ON DELETE CASCADE
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS sound_combination_server_name_idx ON sound_combination (server_id, sound_name)",
+        "CREATE INDEX IF NOT EXISTS sound_combination_sounds_combination_idx ON sound_combination_sounds (combination_id, position)",
+    ]),
+    (5, "create bot state table", [
+        """
+        CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+    ]),
+    (6, "create pending queue table", [
+        # Queues saved at shutdown; channel_id is NULL for a queue that was not playing yet
+        """
+        CREATE TABLE IF NOT EXISTS pending_queue (
+            server_id BIGINT NOT NULL,
+            position INTEGER NOT NULL,
+            channel_id BIGINT,
+            sound_id BIGINT NOT NULL,
+            saved_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (server_id, position)
+        )
+        """,
+    ]),
+    # Migration 2 left the sounds of older combinations at position 0; ctid is the only trace left of
+    # the order they were saved in
+    (7, "backfill playback positions of old combinations", [
+        BACKFILL_POSITIONS,
+    ]),
+]
+
+
+async def migrate():
+    """Apply every migration newer than the database's schema version in one transaction"""
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            await conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "version INTEGER PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            )
+            cur = await conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+            current = (await cur.fetchone())[0]
+
+            for version, description, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+                logger.info(f"Applying migration {version}: {description}")
+                for statement in statements:
+                    await conn.execute(statement)
+                await conn.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+
+
+# The embedded SQLite schema, versioned through PRAGMA user_version. Same rules as MIGRATIONS.
+SQLITE_MIGRATIONS = [
+    (1, "create tables", [
+        """
+        CREATE TABLE IF NOT EXISTS sound_combination (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            server_id INTEGER NOT NULL,
+            sound_name TEXT NOT NULL,
+            UNIQUE (server_id, sound_name)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sound_combination_sounds (
+            combination_id INTEGER NOT NULL REFERENCES sound_combination (id) ON DELETE CASCADE,
+            sound_id INTEGER NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS sound_combination_sounds_combination_idx ON sound_combination_sounds (combination_id, position)",
+        "CREATE TABLE IF NOT EXISTS sound_metadata (sound_id INTEGER PRIMARY KEY, duration REAL NOT NULL)",
+        """
+        CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "create pending queue table", [
+        """
+        CREATE TABLE IF NOT EXISTS pending_queue (
+            server_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            channel_id INTEGER,
+            sound_id INTEGER NOT NULL,
+            saved_at REAL NOT NULL,
+            PRIMARY KEY (server_id, position)
+        )
+        """,
+    ]),
+]
+
+
+def migrate_sqlite(conn):
+    """Apply every SQLite migration newer than the file's user_version in one transaction"""
+    # BEGIN IMMEDIATE takes the write lock up front so two processes can't migrate at once
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, description, statements in SQLITE_MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Applying SQLite migration {version}: {description}")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
@@ -0,0 +1,203 @@
+"""
+Renders a combination into a single Ogg Opus file with FFmpeg so it can be played through the
+voice connection as one gapless stream, instead of one soundboard API call per sound.
+
+COMBINATION_PLAYBACK picks how combinations play: "soundboard" (default) sends each sound,
+"mixed" plays the rendered stream and falls back to the soundboard if rendering fails.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import discord
+
+from audio_cache import audio_cache
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+COMBINATION_PLAYBACK = os.getenv("COMBINATION_PLAYBACK", "soundboard").lower()
+
+
+class MixError(Exception):
+    """FFmpeg is missing or could not render the combination"""
+
+
+class Mix:
+    """A combination queued to play as one pre-mixed stream"""
+
+    def __init__(self, name: str, sounds):
+        self.name = name
+        self.sounds = list(sounds)
+
+    def __repr__(self):
+        return f"<Mix {self.name!r} of {len(self.sounds)} sounds>"
+
+
+def _remove_quietly(path: str):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+class CombinationMixer:
+    """Renders and caches mixed combinations, running at most `concurrency` FFmpeg processes at once.
+
+    Renders are evicted least recently used first, tracked by mtime like the audio cache's objects.
+    """
+
+    def __init__(self, cache_dir: str, max_renders: int, concurrency: int, bitrate: str = "96k"):
+        self.cache_dir = cache_dir
+        self.max_renders = max_renders
+        self.bitrate = bitrate
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._renders = OrderedDict()  # key -> path of the rendered file, least recently used first
+        self._loaded = False
+        self._rendering = SingleFlight()  # by key
+        # All index and file work runs on this one thread, like the audio cache's
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mixer")
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _load(self):
+        # Runs once: count the renders left by earlier runs, oldest use first, so they are evicted too
+        if self._loaded:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".partial"):
+                    _remove_quietly(entry.path)
+                elif entry.name.endswith(".ogg"):
+                    entries.append((entry.stat().st_mtime, entry.name[:-len(".ogg")], entry.path))
+        for _, key, path in sorted(entries):
+            self._renders[key] = path
+        self._evict()
+        self._loaded = True
+
+    def _lookup(self, key):
+        path = self._renders.get(key)
+        if path is None or not os.path.exists(path):
+            return None
+        self._renders.move_to_end(key)
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return path
+
+    def _add(self, key, path):
+        self._renders[key] = path
+        self._renders.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        while len(self._renders) > self.max_renders:
+            _, evicted = self._renders.popitem(last=False)
+            # A stream already playing keeps its open file; only future plays re-render
+            _remove_quietly(evicted)
+
+    def _key(self, sounds):
+        # Volume is baked into the render, so it is part of the key
+        parts = ",".join(f"{sound.id}:{getattr(sound, 'volume', 1.0)}" for sound in sounds)
+        return hashlib.sha256(parts.encode()).hexdigest()
+
+    def prepare(self, sounds):
+        """Start rendering in the background so the file is ready when its turn comes"""
+        key = self._key(sounds)
+        task = self._rendering.task(key, lambda: self._render(key, sounds))
+        # Nobody may await a prepare() that turns out unneeded; don't warn about its exception
+        task.add_done_callback(lambda finished: finished.cancelled() or finished.exception())
+        return task
+
+    async def render(self, sounds):
+        """Return the path of the rendered combination, rendering it unless it is cached"""
+        if not self._loaded:
+            await self._run(self._load)
+        key = self._key(sounds)
+        path = await self._run(self._lookup, key)
+        if path:
+            return path
+        return await self._rendering.run(key, lambda: self._render(key, sounds))
+
+    async def _render(self, key, sounds):
+        if not self._loaded:
+            await self._run(self._load)
+        path = os.path.join(self.cache_dir, f"{key}.ogg")
+        if not await self._run(os.path.exists, path):
+            async with self._semaphore:
+                await self._run_ffmpeg(sounds, path)
+        await self._run(self._add, key, path)
+        return path
+
+    async def _run_ffmpeg(self, sounds, path):
+        # The audio cache downloads each distinct sound once and hands FFmpeg a local file
+        inputs = []
+        try:
+            for sound in sounds:
+                inputs += ["-i", await audio_cache.path(sound)]
+        except (discord.HTTPException, OSError) as e:
+            raise MixError(f"Could not download the sounds: {e}") from e
+
+        # Resample every input to one format, apply its soundboard volume and join them back to back
+        chains = [
+            f"[{index}:a]aresample=48000,aformat=sample_fmts=fltp:channel_layouts=stereo,"
+            f"volume={getattr(sound, 'volume', 1.0)}[a{index}]"
+            for index, sound in enumerate(sounds)
+        ]
+        joined = "".join(f"[a{index}]" for index in range(len(sounds)))
+        graph = ";".join(chains) + f";{joined}concat=n={len(sounds)}:v=0:a=1[out]"
+
+        # Write next to the final path and rename, so a half-written render is never played
+        partial = f"{path}.{os.getpid()}.partial"
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-nostdin", "-v", "error", "-y", *inputs,
+                "-filter_complex", graph, "-map", "[out]",
+                "-c:a", "libopus", "-b:a", self.bitrate, "-f", "ogg", partial,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError as e:
+            raise MixError("ffmpeg is not installed") from e
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            await self._run(_remove_quietly, partial)
+            raise MixError(f"ffmpeg exited with {process.returncode}: {stderr.decode(errors='replace').strip()[-300:]}")
+        await self._run(os.replace, partial, path)
+
+
+async def play_mix(voice_client, path: str):
+    """Stream a rendered file through the voice connection and wait until it has finished"""
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+
+    def after(error):
+        # Runs on the voice player thread
+        loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(error))
+
+    try:
+        voice_client.play(discord.FFmpegOpusAudio(path, codec="copy"), after=after)
+    except discord.ClientException as e:
+        # FFmpeg missing, or the voice client is disconnected or already playing
+        raise MixError(f"Could not start playback: {e}") from e
+    try:
+        error = await finished
+    except asyncio.CancelledError:
+        # Don't leave the stream playing after the queue was stopped or skipped
+        voice_client.stop()
+        raise
+    if error:
+        raise MixError(f"Playback failed: {error}")
+
+
+mixer = CombinationMixer(
+    cache_dir=os.getenv("MIXER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "soundboard-mixes")),
+    max_renders=int(os.getenv("MIXER_MAX_RENDERS", "200")),
+    concurrency=int(os.getenv("MIXER_CONCURRENCY", str(os.cpu_count() or 1))),
+)
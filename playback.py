@@ -0,0 +1,206 @@
+import asyncio
+import logging
+from collections import deque
+
+import discord
+
+from mixer import Mix, MixError, mixer, play_mix
+from sound_metadata import sound_metadata
+
+logger = logging.getLogger(__name__)
+
+
+class GuildPlayer:
+    """Single long-lived worker that plays one guild's sound queue in order"""
+
+    def __init__(self, manager, guild: discord.Guild):
+        self.manager = manager
+        self.guild = guild
+        self.queue = deque()
+        self.current = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._playing = False  # asked to play by start(); False while the worker idles
+
+    @property
+    def depth(self):
+        """Number of sounds waiting to be played"""
+        return len(self.queue)
+
+    @property
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    @property
+    def is_playing(self):
+        """True from start() until the queue has played out; an idle worker is running but not playing"""
+        return self.is_running and self._playing
+
+    def enqueue(self, *sounds):
+        """Append sounds to the end of the queue; returns the new depth, or None if they don't fit.
+
+        Sounds added while the queue is playing are played with it; otherwise they wait for start().
+        """
+        if self.manager.closing or self.depth + len(sounds) > self.manager.max_queue_size:
+            return None
+        self.queue.extend(sounds)
+        return self.depth
+
+    def clear(self):
+        self.queue.clear()
+
+    def start(self):
+        """Play the queue, waking the idle worker or starting one; returns False if it is already playing"""
+        if self.is_playing:
+            return False
+        self._playing = True
+        if self.is_running:
+            self._wakeup.set()
+        else:
+            self._task = asyncio.create_task(self._run())
+        return True
+
+    async def _run(self):
+        try:
+            while True:
+                if not self.queue or not self._playing:
+                    self._playing = False
+                    if self.manager.closing:
+                        break
+                    # Stay around for a while so follow-up plays reuse this worker; only start() wakes it
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.manager.idle_timeout)
+                    except asyncio.TimeoutError:
+                        # A start() can still arrive while the timeout is being handled
+                        if not self._playing:
+                            break
+                    continue
+
+                voice_client = self.guild.voice_client
+                if not voice_client or not voice_client.channel:
+                    logger.warning(f"Not connected to voice in guild {self.guild.id}, dropping {self.depth} queued sounds")
+                    self.queue.clear()
+                    break
+
+                self.current = self.queue.popleft()
+                dispatched = False
+                try:
+                    if isinstance(self.current, Mix):
+                        await self._play_mix(voice_client, self.current)
+                        dispatched = True
+                        continue
+                    await self.manager.dispatcher.send(voice_client.channel, self.current)
+                    dispatched = True
+                    # discord.py has no "is_playing" for soundboard sounds, so wait for the sound's own duration
+                    await asyncio.sleep(await sound_metadata.delay(self.current))
+                except asyncio.CancelledError:
+                    # Stopped before the sound went out; keep it so a shutdown saves it with the rest
+                    if not dispatched:
+                        self.queue.appendleft(self.current)
+                    raise
+                except discord.HTTPException as e:
+                    # The sound was deleted, permissions changed or retries ran out; skip to the next one
+                    logger.warning(f"Could not play {self.current!r} in guild {self.guild.id}: {e}")
+                except Exception:
+                    logger.exception(f"Error playing soundboard sound in guild {self.guild.id}")
+                finally:
+                    self.current = None
+        finally:
+            self._playing = False
+            logger.info(f"Queue finished for guild {self.guild.id}")
+            self.manager._finished(self)
+            self.manager.voice_sessions.release(self.guild)
+
+    async def _play_mix(self, voice_client, mix: Mix):
+        try:
+            await play_mix(voice_client, await mixer.render(mix.sounds))
+        except MixError as e:
+            # Play it sound by sound instead, ahead of everything queued after it
+            logger.warning(f"Could not play mixed combination {mix.name!r} in guild {self.guild.id}, "
+                           f"falling back to the soundboard: {e}")
+            self.queue.extendleft(reversed(mix.sounds))
+
+
+class PlaybackManager:
+    """Owns the GuildPlayer of every guild that is currently playing or has queued sounds"""
+
+    def __init__(self, voice_sessions, dispatcher, idle_timeout: float, max_queue_size: int = 50):
+        self.voice_sessions = voice_sessions
+        self.dispatcher = dispatcher
+        self.idle_timeout = idle_timeout
+        self.max_queue_size = max_queue_size
+        self.closing = False
+        self._players = {}  # guild id -> GuildPlayer
+
+    @property
+    def active_count(self):
+        """Number of guild players currently running"""
+        return sum(player.is_running for player in self._players.values())
+
+    @property
+    def queued_count(self):
+        """Number of sounds waiting across every guild queue"""
+        return sum(player.depth for player in self._players.values())
+
+    def get(self, guild: discord.Guild):
+        player = self._players.get(guild.id)
+        if player is None:
+            player = self._players[guild.id] = GuildPlayer(self, guild)
+        return player
+
+    async def connect(self, interaction: discord.Interaction):
+        """Join the invoking user's voice channel (or keep the current one); None if neither exists"""
+        guild = interaction.guild
+        player = self._players.get(guild.id)
+        current = guild.voice_client.channel if guild.voice_client else None
+        if interaction.user.voice and not (current and player and player.is_playing):
+            channel = interaction.user.voice.channel
+        else:
+            # Never pull a running queue away from the channel it is playing in
+            channel = current
+        if channel is None:
+            return None
+        return await self.voice_sessions.connect(guild, channel)
+
+    def reset(self, guild: discord.Guild):
+        """Drop the guild's pending queue unless it is currently playing"""
+        player = self._players.get(guild.id)
+        if player and not player.is_playing:
+            player.clear()
+            if not player.is_running:
+                del self._players[guild.id]
+
+    def close(self):
+        """Refuse new sounds from now on and let idle players exit instead of waiting for more"""
+        self.closing = True
+        for player in self._players.values():
+            player._wakeup.set()
+
+    async def drain(self, timeout: float):
+        """Wait up to timeout seconds for the running players to play their queues; returns how many are left"""
+        tasks = [player._task for player in self._players.values() if player.is_running]
+        if not tasks:
+            return 0
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        return len(pending)
+
+    async def stop(self):
+        """Stop every player and return [(guild, playing, queued items)] for the queues left over"""
+        tasks = [player._task for player in self._players.values() if player.is_running]
+        # Read before cancelling: a stopped player is no longer running
+        playing = {player.guild.id for player in self._players.values() if player.is_playing}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        leftover = [
+            (player.guild, player.guild.id in playing, list(player.queue))
+            for player in self._players.values() if player.queue
+        ]
+        self._players.clear()
+        return leftover
+
+    def _finished(self, player: GuildPlayer):
+        # Keep players that still hold queued sounds (e.g. added while shutting down)
+        if not player.queue and self._players.get(player.guild.id) is player:
+            del self._players[player.guild.id]
@@ -0,0 +1,37 @@
+from bisect import bisect_left, insort
+
+
+class PrefixIndex:
+    """Names kept sorted by their case-folded form, for case-insensitive prefix lookups with bisect"""
+
+    def __init__(self, names=()):
+        self._keys = sorted((name.casefold(), name) for name in names)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, name):
+        key = (name.casefold(), name)
+        index = bisect_left(self._keys, key)
+        return index < len(self._keys) and self._keys[index] == key
+
+    def add(self, name: str):
+        if name not in self:
+            insort(self._keys, (name.casefold(), name))
+
+    def discard(self, name: str):
+        key = (name.casefold(), name)
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+
+    def search(self, prefix: str, limit: int = 25):
+        """Up to `limit` names starting with prefix (ignoring case), in alphabetical order"""
+        prefix = prefix.casefold()
+        matches = []
+        for index in range(bisect_left(self._keys, (prefix,)), len(self._keys)):
+            key, name = self._keys[index]
+            if not key.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(name)
+        return matches
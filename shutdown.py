@@ -0,0 +1,123 @@
+"""
+Orderly shutdown on SIGTERM or SIGINT, so rolling restarts don't drop anyone's queue:
+
+    1. stop accepting new sounds
+    2. let the playing queues finish for up to SHUTDOWN_DRAIN_TIMEOUT seconds
+    3. save what is still queued to the database; the next start restores it
+    4. leave every voice channel and close the bot
+
+The caller closes the health server and the database after the bot has stopped.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from mixer import Mix
+from sound_cache import sound_cache
+from storage import store
+
+logger = logging.getLogger(__name__)
+
+# Queues older than this are not restored; the users have moved on
+QUEUE_RESTORE_MAX_AGE = float(os.getenv("QUEUE_RESTORE_MAX_AGE", "300"))
+
+
+class ShutdownCoordinator:
+    """Runs the shutdown steps once, on the first SIGTERM or SIGINT"""
+
+    def __init__(self, bot, drain_timeout: float):
+        self.bot = bot
+        self.drain_timeout = drain_timeout
+        self._task = None
+
+    @property
+    def stopping(self):
+        return self._task is not None
+
+    def install(self):
+        """Handle SIGTERM and SIGINT on the running event loop"""
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, self.request, signum)
+            except NotImplementedError:
+                # Windows has no loop signal handlers; Ctrl+C still stops the bot, just without draining
+                return
+
+    def request(self, signum=signal.SIGTERM):
+        if self._task is not None:
+            logger.info(f"Received {signal.Signals(signum).name} again, already shutting down")
+            return
+        logger.info(f"Received {signal.Signals(signum).name}, shutting down")
+        self._task = asyncio.create_task(self.shutdown())
+
+    async def shutdown(self):
+        started = time.monotonic()
+        players = self.bot.players
+        try:
+            players.close()
+            left = await players.drain(self.drain_timeout)
+            if left:
+                logger.info(f"{left} queue(s) still playing after {self.drain_timeout:.0f}s, saving them")
+            leftover = await players.stop()
+            try:
+                await save_queues(leftover)
+            except Exception as e:
+                logger.error(f"Failed to save {len(leftover)} queue(s): {e}")
+            await self.bot.voice_sessions.close(self.bot.voice_clients)
+            logger.info(f"Shutdown finished in {time.monotonic() - started:.1f}s")
+        finally:
+            await self.bot.close()
+
+
+async def save_queues(leftover):
+    """Save the queues returned by PlaybackManager.stop(); returns how many were saved"""
+    queues = []
+    for guild, playing, items in leftover:
+        # Mixes are saved as their sounds; they play sound by sound after the restart
+        sound_ids = [sound.id for item in items for sound in (item.sounds if isinstance(item, Mix) else (item,))]
+        voice_client = guild.voice_client
+        channel_id = voice_client.channel.id if playing and voice_client and voice_client.channel else None
+        queues.append((guild.id, channel_id, sound_ids))
+    if queues:
+        await store.save_queues(queues)
+        logger.info(f"Saved {len(queues)} queue(s)")
+    return len(queues)
+
+
+async def restore_queues(bot):
+    """Put back the queues saved by the last shutdown for this process's guilds; returns how many"""
+    saved = await store.take_queues([guild.id for guild in bot.guilds], QUEUE_RESTORE_MAX_AGE)
+
+    async def restore(guild_id, channel_id, sound_ids):
+        guild = bot.get_guild(guild_id)
+        sounds = [sound_cache.find(guild, sound_id) for sound_id in sound_ids]
+        sounds = [sound for sound in sounds if sound is not None][:bot.players.max_queue_size]
+        if not sounds:
+            return False
+        player = bot.players.get(guild)
+        if channel_id is None:
+            # It was never started; the soundboard's play button still starts it
+            player.enqueue(*sounds)
+            return True
+        channel = guild.get_channel(channel_id)
+        if channel is None:
+            return False
+        try:
+            await bot.voice_sessions.connect(guild, channel)
+        except Exception as e:
+            logger.warning(f"Could not rejoin voice in guild {guild_id} to resume its queue: {e}")
+            return False
+        player.enqueue(*sounds)
+        player.start()
+        return True
+
+    results = await asyncio.gather(
+        *(restore(guild_id, channel_id, sound_ids) for guild_id, (channel_id, sound_ids) in saved.items())
+    )
+    if saved:
+        logger.info(f"Restored {sum(results)} of {len(saved)} saved queue(s)")
+    return sum(results)
@@ -0,0 +1,21 @@
+import asyncio
+
+
+class SingleFlight:
+    """At most one task per key; callers asking for a key while its task runs share that task"""
+
+    def __init__(self):
+        self._tasks = {}  # key -> running task
+
+    def task(self, key, coro_factory):
+        """Return the running task for `key`, starting coro_factory() as one if there is none"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(coro_factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return task
+
+    async def run(self, key, coro_factory):
+        """Await the task for `key`, shielded so one cancelled caller does not cancel it for the others"""
+        return await asyncio.shield(self.task(key, coro_factory))
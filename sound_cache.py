@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import discord
+
+from audio_cache import audio_cache
+from instrumentation import fetch_sounds_seconds, guild_bucket, timed
+from prefix_index import PrefixIndex
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class SoundCache:
+    """Per-guild soundboard sounds with a TTL, LRU eviction and single-flight fetches"""
+
+    def __init__(self, ttl: float, max_guilds: int):
+        self.ttl = ttl
+        self.max_guilds = max_guilds
+        self._entries = OrderedDict()  # guild id -> (expires_at, {sound name: sound}, PrefixIndex of the names)
+        self._fetches = SingleFlight()  # by guild id
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, guild: discord.Guild):
+        """Return the guild's sounds by name, fetching them only when missing or expired"""
+        entry = self._entries.get(guild.id)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(guild.id)
+            return entry[1]
+
+        return await self._fetches.run(guild.id, lambda: self._fetch(guild))
+
+    async def names(self, guild: discord.Guild):
+        """Prefix index of the guild's sound names, fetching the sounds if needed"""
+        sounds = await self.get(guild)
+        entry = self._entries.get(guild.id)
+        return entry[2] if entry else PrefixIndex(sounds)
+
+    def find(self, guild: discord.Guild, sound_id: int):
+        """Return a sound by id from the cache or the gateway's guild cache, without a REST call"""
+        entry = self._entries.get(guild.id)
+        if entry:
+            for sound in entry[1].values():
+                if sound.id == sound_id:
+                    return sound
+        return guild.get_soundboard_sound(sound_id)
+
+    def sound_ids(self):
+        """Ids of every cached sound"""
+        return [sound.id for _, sounds, _ in self._entries.values() for sound in sounds.values()]
+
+    def put(self, guild_id: int, sounds: dict):
+        """Store a guild's sounds and evict the least recently used guilds over the limit"""
+        self._entries[guild_id] = (time.monotonic() + self.ttl, sounds, PrefixIndex(sounds))
+        self._entries.move_to_end(guild_id)
+        while len(self._entries) > self.max_guilds:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, guild_id: int):
+        """Drop a guild's sounds so the next get() fetches them again"""
+        self._entries.pop(guild_id, None)
+
+    async def prewarm(self, guilds, concurrency: int = 10):
+        """Fill the cache for up to max_guilds guilds, biggest first; returns how many were cached.
+
+        The gateway delivers every available guild's sounds, so its list is used as it is, even when
+        empty; only unavailable guilds cost a REST call, and at most `concurrency` of those run at once.
+        """
+        guilds = sorted(guilds, key=lambda guild: guild.member_count or 0, reverse=True)[:self.max_guilds]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def warm(guild):
+            if not guild.unavailable:
+                self.put(guild.id, {sound.name: sound for sound in guild.soundboard_sounds})
+                return
+            async with semaphore:
+                await self.get(guild)
+
+        await asyncio.gather(*(warm(guild) for guild in guilds if guild.id not in self._entries))
+        return len(guilds)
+
+    def _update(self, guild_id: int, change):
+        entry = self._entries.get(guild_id)
+        if entry is None:
+            return
+        # Copy so views already holding the old dict keep a consistent page; the index is ours to mutate
+        sounds = dict(entry[1])
+        change(sounds, entry[2])
+        self._entries[guild_id] = (entry[0], sounds, entry[2])
+
+    def sound_created(self, sound: discord.SoundboardSound):
+        def change(sounds, names):
+            sounds[sound.name] = sound
+            names.add(sound.name)
+        self._update(sound.guild.id, change)
+
+    def sound_updated(self, before: discord.SoundboardSound, after: discord.SoundboardSound):
+        def change(sounds, names):
+            # The name may have changed, so drop the old entry by id
+            _remove_sound(sounds, names, after.id)
+            sounds[after.name] = after
+            names.add(after.name)
+        self._update(after.guild.id, change)
+
+    def sound_deleted(self, sound: discord.SoundboardSound):
+        self._update(sound.guild.id, lambda sounds, names: _remove_sound(sounds, names, sound.id))
+
+    async def _fetch(self, guild: discord.Guild):
+        try:
+            with timed(fetch_sounds_seconds, guild_bucket=guild_bucket(guild)):
+                soundboard_sounds = await guild.fetch_soundboard_sounds()
+        except Exception as e:
+            logger.error(f"Error loading soundboard sounds for guild {guild.id}: {e}")
+            return {}
+
+        sounds = {sound.name: sound for sound in soundboard_sounds}
+        if not sounds:
+            logger.warning(f"No soundboard sounds found for guild {guild.name}")
+        else:
+            logger.info(f"Loaded {len(sounds)} soundboard sounds for guild {guild.id}")
+        self.put(guild.id, sounds)
+        return sounds
+
+
+def _remove_sound(sounds: dict, names: PrefixIndex, sound_id: int):
+    for name, cached in list(sounds.items()):
+        if cached.id == sound_id:
+            del sounds[name]
+            names.discard(name)
+
+
+sound_cache = SoundCache(
+    ttl=float(os.getenv("SOUND_CACHE_TTL", "3600")),
+    max_guilds=int(os.getenv("SOUND_CACHE_MAX_GUILDS", "1000")),
+)
+
+
+# Gateway listeners keeping the cache current; added to the bot in main.py
+async def on_soundboard_sound_create(sound: discord.SoundboardSound):
+    sound_cache.sound_created(sound)
+
+
+async def on_soundboard_sound_update(before: discord.SoundboardSound, after: discord.SoundboardSound):
+    sound_cache.sound_updated(before, after)
+    # Check the audio again on next use; unchanged audio hashes to the object already on disk
+    await audio_cache.invalidate(after.id)
+
+
+async def on_soundboard_sound_delete(sound: discord.SoundboardSound):
+    sound_cache.sound_deleted(sound)
+    await audio_cache.invalidate(sound.id)
+
+
+async def on_guild_remove(guild: discord.Guild):
+    # The bot left or was removed; the guild's sounds can't be played any more
+    sound_cache.invalidate(guild.id)
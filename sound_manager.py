@@ -2,7 +2,10 @@
 Utility script for managing Discord soundboard bot configuration
 """
 
+import argparse
+import asyncio
 import os
+import sys
 from dotenv import load_dotenv
 
 
@@ -85,6 +88,10 @@ STEP 6: Use Soundboard
    /soundboard - Show interactive soundboard and combine sound
    /listsounds - List all available sounds
 
+📦 MOVING COMBINATIONS:
+   python sound_manager.py export combinations.ndjson [--server-id ID]
+   python sound_manager.py import combinations.ndjson [--server-id ID]
+
 📞 NEED HELP?
    Discord.py: https://discordpy.readthedocs.io/
    Discord API: https://discord.com/developers/docs
@@ -92,11 +99,43 @@ STEP 6: Use Soundboard
     print(instructions)
 
 
+async def transfer_combinations(command, path, server_id=None):
+    """Export combinations to path, or import them from it ("-" is stdout/stdin)"""
+    load_dotenv()
+    # Imported here because the storage settings are read from .env when the module loads
+    import transfer
+    from storage import store
+
+    await store.open()
+    try:
+        if command == "export":
+            if path == "-":
+                count = await transfer.export_combinations(sys.stdout.write, server_id)
+            else:
+                with open(path, "w", encoding="utf-8") as f:
+                    count = await transfer.export_combinations(f.write, server_id)
+            print(f"✅ Exported {count} combination(s)", file=sys.stderr)
+        else:
+            if path == "-":
+                count = await transfer.import_combinations(sys.stdin, server_id)
+            else:
+                with open(path, encoding="utf-8") as f:
+                    count = await transfer.import_combinations(f, server_id)
+            print(f"✅ Imported {count} combination(s)", file=sys.stderr)
+    finally:
+        await store.close()
+
+
 if __name__ == "__main__":
-    import sys
-    
     if len(sys.argv) > 1 and sys.argv[1] == "--help":
         get_setup_instructions()
+    elif len(sys.argv) > 1 and sys.argv[1] in ("export", "import"):
+        parser = argparse.ArgumentParser(prog="sound_manager.py", description="Export or import combinations")
+        parser.add_argument("command", choices=("export", "import"))
+        parser.add_argument("path", help="NDJSON file to write or read, - for stdout/stdin")
+        parser.add_argument("--server-id", type=int, help="export only this server / import everything into this server")
+        args = parser.parse_args()
+        asyncio.run(transfer_combinations(args.command, args.path, args.server_id))
     else:
         check_env_setup()
 
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import os
+
+import discord
+
+from audio_cache import audio_cache
+from single_flight import SingleFlight
+from storage import store
+
+logger = logging.getLogger(__name__)
+
+
+class SoundMetadataIndex:
+    """Durations of soundboard sounds, probed once from the audio asset and persisted"""
+
+    def __init__(self, default_duration: float, gap: float):
+        self.default_duration = default_duration
+        self.gap = gap
+        self._durations = {}  # sound id -> duration in seconds
+        self._resolving = SingleFlight()  # by sound id
+
+    async def duration(self, sound: discord.SoundboardSound):
+        """Return how long the sound plays for, in seconds"""
+        if sound.id in self._durations:
+            return self._durations[sound.id]
+
+        return await self._resolving.run(sound.id, lambda: self._resolve(sound))
+
+    async def preload(self, sound_ids, batch_size: int = 1000):
+        """Load the persisted durations of many sounds with one query per batch"""
+        missing = [sound_id for sound_id in sound_ids if sound_id not in self._durations]
+        for start in range(0, len(missing), batch_size):
+            self._durations.update(await store.get_durations(missing[start:start + batch_size]))
+
+    async def delay(self, sound: discord.SoundboardSound):
+        """Return how long to wait after sending the sound before sending the next one"""
+        return await self.duration(sound) + self.gap
+
+    async def _resolve(self, sound: discord.SoundboardSound):
+        try:
+            duration = await store.get_duration(sound.id)
+            if duration is not None:
+                self._durations[sound.id] = duration
+                return duration
+
+            duration = await self._probe(sound)
+        except Exception as e:
+            # Keep playback going; the sound is probed again after a restart
+            logger.warning(f"Could not determine duration of sound {sound.id}: {e}")
+            duration = self.default_duration
+        else:
+            try:
+                await store.set_duration(sound.id, duration)
+            except Exception as e:
+                # The probed duration is still right for this run; it is probed again after a restart
+                logger.warning(f"Could not save duration of sound {sound.id}: {e}")
+
+        self._durations[sound.id] = duration
+        return duration
+
+    async def _probe(self, sound: discord.SoundboardSound):
+        path = await audio_cache.path(sound)
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            "-i", path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+        return float(stdout.decode().strip())
+
+
+sound_metadata = SoundMetadataIndex(
+    default_duration=float(os.getenv("DEFAULT_SOUND_DURATION", "3.5")),
+    gap=float(os.getenv("PLAYBACK_GAP", "0.25")),
+)
@@ -0,0 +1,489 @@
+"""
+Storage backends for combinations, sound durations, bot state and queues saved at shutdown.
+
+STORAGE_BACKEND selects the backend: "postgres" (default, configured by the DB_* settings)
+or "sqlite", an embedded database file at SQLITE_PATH that needs no server.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import migrations
+from instrumentation import db_query_seconds, statement_label, timed
+
+logger = logging.getLogger(__name__)
+
+
+class CombinationStore(ABC):
+    """Interface every storage backend implements"""
+
+    @abstractmethod
+    async def open(self):
+        """Connect and bring the schema up to date"""
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+    @property
+    @abstractmethod
+    def is_open(self):
+        pass
+
+    def pool_stats(self):
+        """Connection pool statistics in psycopg_pool's get_stats() format ({} without a pool)"""
+        return {}
+
+    @abstractmethod
+    async def list_combinations(self, server_id):
+        """Every combination of a server as {name: [sound ids in playback order]}"""
+
+    @abstractmethod
+    async def create_combination(self, server_id, sound_name, sound_ids):
+        """Save a combination and its ordered sounds atomically; False if the name is taken"""
+
+    @abstractmethod
+    async def delete_combination(self, server_id, sound_name):
+        """Delete a combination with its sounds; False if it did not exist"""
+
+    @abstractmethod
+    def iter_combinations(self, server_id=None):
+        """Async iterator of (server_id, sound_name, sound ids) for one server or all, streamed in batches"""
+
+    @abstractmethod
+    async def upsert_combinations(self, rows):
+        """Create or replace many (server_id, sound_name, sound ids) combinations in one transaction"""
+
+    @abstractmethod
+    async def get_duration(self, sound_id):
+        pass
+
+    @abstractmethod
+    async def get_durations(self, sound_ids):
+        """{sound id: duration} for the given sounds that have a stored duration"""
+
+    @abstractmethod
+    async def set_duration(self, sound_id, duration):
+        pass
+
+    @abstractmethod
+    async def get_state(self, key):
+        pass
+
+    @abstractmethod
+    async def set_state(self, key, value):
+        pass
+
+    @abstractmethod
+    async def save_queues(self, queues):
+        """Save (server_id, channel_id, sound ids) queues, replacing any saved for the same servers"""
+
+    @abstractmethod
+    async def take_queues(self, server_ids, max_age: float):
+        """Remove the servers' saved queues and return {server_id: (channel_id, sound ids)} of those
+        saved within the last max_age seconds"""
+
+    @abstractmethod
+    async def truncate(self):
+        """Delete every stored row; only used by the benchmarks"""
+
+
+def _group_combinations(rows):
+    combinations = {}
+    for sound_name, sound_id in rows:
+        sound_ids = combinations.setdefault(sound_name, [])
+        if sound_id is not None:
+            sound_ids.append(sound_id)
+    return combinations
+
+
+def _group_queues(rows):
+    # rows are (server_id, position, channel_id, sound_id, fresh); stale queues are dropped
+    queues = {}
+    for server_id, _, channel_id, sound_id, fresh in sorted(rows):
+        if fresh:
+            queues.setdefault(server_id, (channel_id, []))[1].append(sound_id)
+    return queues
+
+
+class PostgresStore(CombinationStore):
+    """Postgres through the connection pool in database.py"""
+
+    COMBINATIONS_QUERY = """
+        SELECT sc.sound_name,
+               COALESCE(
+                   array_agg(scs.sound_id ORDER BY scs.position) FILTER (WHERE scs.sound_id IS NOT NULL),
+                   '{}'
+               )
+        FROM sound_combination sc
+        LEFT JOIN sound_combination_sounds scs ON scs.combination_id = sc.id
+        WHERE sc.server_id = %s
+        GROUP BY sc.id, sc.sound_name
+        ORDER BY sc.sound_name
+    """
+
+    async def open(self):
+        await database.open_pool()
+        await migrations.migrate()
+
+    async def close(self):
+        await database.close_pool()
+
+    @property
+    def is_open(self):
+        return not database.pool.closed
+
+    def pool_stats(self):
+        return database.pool.get_stats()
+
+    async def list_combinations(self, server_id):
+        rows = await database.fetchall(self.COMBINATIONS_QUERY, (server_id,))
+        return {sound_name: list(sound_ids) for sound_name, sound_ids in rows}
+
+    async def create_combination(self, server_id, sound_name, sound_ids):
+        with timed(db_query_seconds, statement="insert_combination"):
+            async with database.pool.connection() as conn:
+                async with conn.transaction():
+                    cur = await conn.execute(
+                        "INSERT INTO sound_combination (server_id, sound_name) VALUES (%s, %s) "
+                        "ON CONFLICT (server_id, sound_name) DO NOTHING RETURNING id",
+                        (server_id, sound_name)
+                    )
+                    row = await cur.fetchone()
+                    if row is None:
+                        return False
+                    await conn.execute(
+                        "INSERT INTO sound_combination_sounds (combination_id, sound_id, position) "
+                        "SELECT %s, t.sound_id, t.position - 1 "
+                        "FROM unnest(%s::bigint[]) WITH ORDINALITY AS t(sound_id, position)",
+                        (row[0], list(sound_ids))
+                    )
+        return True
+
+    async def delete_combination(self, server_id, sound_name):
+        # The sounds go with it through ON DELETE CASCADE
+        deleted = await database.execute(
+            "DELETE FROM sound_combination WHERE server_id = %s AND sound_name = %s",
+            (server_id, sound_name)
+        )
+        return deleted > 0
+
+    async def iter_combinations(self, server_id=None):
+        where, params = ("WHERE sc.server_id = %s ", (server_id,)) if server_id is not None else ("", ())
+        query = (
+            "COPY (SELECT sc.server_id, sc.sound_name, "
+            "COALESCE(array_agg(scs.sound_id ORDER BY scs.position) FILTER (WHERE scs.sound_id IS NOT NULL), '{}') "
+            "FROM sound_combination sc "
+            "LEFT JOIN sound_combination_sounds scs ON scs.combination_id = sc.id "
+            + where +
+            "GROUP BY sc.id ORDER BY sc.server_id, sc.sound_name) TO STDOUT"
+        )
+        with timed(db_query_seconds, statement="export_combinations"):
+            async with database.pool.connection() as conn:
+                async with conn.cursor().copy(query, params) as copy:
+                    copy.set_types(["int8", "text", "int8[]"])
+                    async for row in copy.rows():
+                        yield row
+
+    async def upsert_combinations(self, rows):
+        with timed(db_query_seconds, statement="import_combinations"):
+            async with database.pool.connection() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        "CREATE TEMP TABLE combination_import "
+                        "(server_id BIGINT, sound_name TEXT, sound_ids BIGINT[]) ON COMMIT DROP"
+                    )
+                    async with conn.cursor().copy("COPY combination_import FROM STDIN") as copy:
+                        copy.set_types(["int8", "text", "int8[]"])
+                        for row in rows:
+                            await copy.write_row(row)
+                    await conn.execute(
+                        "INSERT INTO sound_combination (server_id, sound_name) "
+                        "SELECT server_id, sound_name FROM combination_import "
+                        "ON CONFLICT (server_id, sound_name) DO NOTHING"
+                    )
+                    await conn.execute(
+                        "DELETE FROM sound_combination_sounds scs "
+                        "USING sound_combination sc, combination_import i "
+                        "WHERE scs.combination_id = sc.id AND sc.server_id = i.server_id AND sc.sound_name = i.sound_name"
+                    )
+                    await conn.execute(
+                        "INSERT INTO sound_combination_sounds (combination_id, sound_id, position) "
+                        "SELECT sc.id, t.sound_id, t.position - 1 FROM combination_import i "
+                        "JOIN sound_combination sc ON sc.server_id = i.server_id AND sc.sound_name = i.sound_name "
+                        "CROSS JOIN LATERAL unnest(i.sound_ids) WITH ORDINALITY AS t(sound_id, position)"
+                    )
+
+    async def get_duration(self, sound_id):
+        row = await database.fetchone("SELECT duration FROM sound_metadata WHERE sound_id = %s", (sound_id,))
+        return row[0] if row else None
+
+    async def get_durations(self, sound_ids):
+        rows = await database.fetchall(
+            "SELECT sound_id, duration FROM sound_metadata WHERE sound_id = ANY(%s)", (list(sound_ids),)
+        )
+        return dict(rows)
+
+    async def set_duration(self, sound_id, duration):
+        await database.execute(
+            "INSERT INTO sound_metadata (sound_id, duration) VALUES (%s, %s) "
+            "ON CONFLICT (sound_id) DO UPDATE SET duration = EXCLUDED.duration",
+            (sound_id, duration)
+        )
+
+    async def get_state(self, key):
+        row = await database.fetchone("SELECT value FROM bot_state WHERE key = %s", (key,))
+        return row[0] if row else None
+
+    async def set_state(self, key, value):
+        await database.execute(
+            "INSERT INTO bot_state (key, value) VALUES (%s, %s) "
+            "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = now()",
+            (key, value)
+        )
+
+    async def save_queues(self, queues):
+        queues = list(queues)
+        with timed(db_query_seconds, statement="save_queues"):
+            async with database.pool.connection() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        "DELETE FROM pending_queue WHERE server_id = ANY(%s)",
+                        ([server_id for server_id, _, _ in queues],)
+                    )
+                    async with conn.cursor() as cur:
+                        await cur.executemany(
+                            "INSERT INTO pending_queue (server_id, position, channel_id, sound_id) VALUES (%s, %s, %s, %s)",
+                            [
+                                (server_id, position, channel_id, sound_id)
+                                for server_id, channel_id, sound_ids in queues
+                                for position, sound_id in enumerate(sound_ids)
+                            ]
+                        )
+
+    async def take_queues(self, server_ids, max_age: float):
+        rows = await database.fetchall(
+            "DELETE FROM pending_queue WHERE server_id = ANY(%s) "
+            "RETURNING server_id, position, channel_id, sound_id, saved_at > now() - make_interval(secs => %s)",
+            (list(server_ids), max_age)
+        )
+        return _group_queues(rows)
+
+    async def truncate(self):
+        await database.execute(
+            "TRUNCATE sound_combination, sound_combination_sounds, sound_metadata, bot_state, pending_queue "
+            "RESTART IDENTITY CASCADE"
+        )
+
+
+class SQLiteStore(CombinationStore):
+    """Embedded SQLite file in WAL mode; every statement runs on one dedicated thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        # sqlite3 connections are not thread safe, so all access goes through a single worker thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    async def _run(self, label, function, *args):
+        with timed(db_query_seconds, statement=label):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _execute(self, query, params=()):
+        def run():
+            with self._conn:
+                return self._conn.execute(query, params).rowcount
+        return await self._run(statement_label(query), run)
+
+    async def _fetchone(self, query, params=()):
+        return await self._run(statement_label(query), lambda: self._conn.execute(query, params).fetchone())
+
+    async def _fetchall(self, query, params=()):
+        return await self._run(statement_label(query), lambda: self._conn.execute(query, params).fetchall())
+
+    async def open(self):
+        def connect():
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("PRAGMA busy_timeout=5000")
+            migrations.migrate_sqlite(conn)
+            return conn
+        self._conn = await asyncio.get_running_loop().run_in_executor(self._executor, connect)
+        logger.info(f"SQLite database ready ({self.path})")
+
+    async def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await asyncio.get_running_loop().run_in_executor(self._executor, conn.close)
+
+    @property
+    def is_open(self):
+        return self._conn is not None
+
+    async def list_combinations(self, server_id):
+        rows = await self._fetchall(
+            "SELECT sc.sound_name, scs.sound_id FROM sound_combination sc "
+            "LEFT JOIN sound_combination_sounds scs ON scs.combination_id = sc.id "
+            "WHERE sc.server_id = ? ORDER BY sc.sound_name, scs.position",
+            (server_id,)
+        )
+        return _group_combinations(rows)
+
+    async def create_combination(self, server_id, sound_name, sound_ids):
+        def insert():
+            with self._conn:
+                cur = self._conn.execute(
+                    "INSERT INTO sound_combination (server_id, sound_name) VALUES (?, ?) "
+                    "ON CONFLICT (server_id, sound_name) DO NOTHING",
+                    (server_id, sound_name)
+                )
+                if cur.rowcount == 0:
+                    return False
+                self._conn.executemany(
+                    "INSERT INTO sound_combination_sounds (combination_id, sound_id, position) VALUES (?, ?, ?)",
+                    [(cur.lastrowid, sound_id, position) for position, sound_id in enumerate(sound_ids)]
+                )
+            return True
+        return await self._run("insert_combination", insert)
+
+    async def delete_combination(self, server_id, sound_name):
+        deleted = await self._execute(
+            "DELETE FROM sound_combination WHERE server_id = ? AND sound_name = ?", (server_id, sound_name)
+        )
+        return deleted > 0
+
+    async def iter_combinations(self, server_id=None, batch_size: int = 1000):
+        query = (
+            "SELECT sc.server_id, sc.sound_name, scs.sound_id FROM sound_combination sc "
+            "LEFT JOIN sound_combination_sounds scs ON scs.combination_id = sc.id "
+        )
+        if server_id is None:
+            cursor = await self._run("export_combinations", self._conn.execute,
+                                     query + "ORDER BY sc.server_id, sc.sound_name, scs.position")
+        else:
+            cursor = await self._run("export_combinations", self._conn.execute,
+                                     query + "WHERE sc.server_id = ? ORDER BY sc.sound_name, scs.position", (server_id,))
+        # Rows of one combination are adjacent, so each is complete once the next one starts
+        current = None
+        while rows := await self._run("export_combinations", cursor.fetchmany, batch_size):
+            for row_server_id, sound_name, sound_id in rows:
+                if current is None or current[:2] != (row_server_id, sound_name):
+                    if current is not None:
+                        yield current
+                    current = (row_server_id, sound_name, [])
+                if sound_id is not None:
+                    current[2].append(sound_id)
+        if current is not None:
+            yield current
+
+    async def upsert_combinations(self, rows):
+        def upsert():
+            with self._conn:
+                for server_id, sound_name, sound_ids in rows:
+                    self._conn.execute(
+                        "INSERT INTO sound_combination (server_id, sound_name) VALUES (?, ?) "
+                        "ON CONFLICT (server_id, sound_name) DO NOTHING",
+                        (server_id, sound_name)
+                    )
+                    combination_id = self._conn.execute(
+                        "SELECT id FROM sound_combination WHERE server_id = ? AND sound_name = ?",
+                        (server_id, sound_name)
+                    ).fetchone()[0]
+                    self._conn.execute("DELETE FROM sound_combination_sounds WHERE combination_id = ?", (combination_id,))
+                    self._conn.executemany(
+                        "INSERT INTO sound_combination_sounds (combination_id, sound_id, position) VALUES (?, ?, ?)",
+                        [(combination_id, sound_id, position) for position, sound_id in enumerate(sound_ids)]
+                    )
+        await self._run("import_combinations", upsert)
+
+    async def get_duration(self, sound_id):
+        row = await self._fetchone("SELECT duration FROM sound_metadata WHERE sound_id = ?", (sound_id,))
+        return row[0] if row else None
+
+    async def get_durations(self, sound_ids):
+        sound_ids = list(sound_ids)
+        if not sound_ids:
+            return {}
+        placeholders = ", ".join("?" * len(sound_ids))
+        rows = await self._fetchall(
+            f"SELECT sound_id, duration FROM sound_metadata WHERE sound_id IN ({placeholders})", sound_ids
+        )
+        return dict(rows)
+
+    async def set_duration(self, sound_id, duration):
+        await self._execute(
+            "INSERT INTO sound_metadata (sound_id, duration) VALUES (?, ?) "
+            "ON CONFLICT (sound_id) DO UPDATE SET duration = excluded.duration",
+            (sound_id, duration)
+        )
+
+    async def get_state(self, key):
+        row = await self._fetchone("SELECT value FROM bot_state WHERE key = ?", (key,))
+        return row[0] if row else None
+
+    async def set_state(self, key, value):
+        await self._execute(
+            "INSERT INTO bot_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP",
+            (key, value)
+        )
+
+    async def save_queues(self, queues):
+        def save():
+            saved_at = time.time()
+            with self._conn:
+                for server_id, channel_id, sound_ids in queues:
+                    self._conn.execute("DELETE FROM pending_queue WHERE server_id = ?", (server_id,))
+                    self._conn.executemany(
+                        "INSERT INTO pending_queue (server_id, position, channel_id, sound_id, saved_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(server_id, position, channel_id, sound_id, saved_at)
+                         for position, sound_id in enumerate(sound_ids)]
+                    )
+        await self._run("save_queues", save)
+
+    async def take_queues(self, server_ids, max_age: float):
+        def take():
+            # Only a handful of queues are ever saved, so filtering them here beats a huge IN list
+            server_ids_set = set(server_ids)
+            fresh_after = time.time() - max_age
+            with self._conn:
+                rows = [
+                    (server_id, position, channel_id, sound_id, saved_at > fresh_after)
+                    for server_id, position, channel_id, sound_id, saved_at in self._conn.execute(
+                        "SELECT server_id, position, channel_id, sound_id, saved_at FROM pending_queue"
+                    )
+                    if server_id in server_ids_set
+                ]
+                self._conn.executemany(
+                    "DELETE FROM pending_queue WHERE server_id = ?", [(server_id,) for server_id in {row[0] for row in rows}]
+                )
+            return rows
+        return _group_queues(await self._run("take_queues", take))
+
+    async def truncate(self):
+        def clear():
+            with self._conn:
+                for table in ("sound_combination_sounds", "sound_combination", "sound_metadata", "bot_state", "pending_queue"):
+                    self._conn.execute(f"DELETE FROM {table}")
+        await self._run("truncate", clear)
+
+
+def create_store():
+    backend = os.getenv("STORAGE_BACKEND", "postgres").lower()
+    if backend == "sqlite":
+        return SQLiteStore(os.getenv("SQLITE_PATH", "soundboard.db"))
+    if backend == "postgres":
+        return PostgresStore()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, expected 'postgres' or 'sqlite'")
+
+
+store = create_store()
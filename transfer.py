@@ -0,0 +1,72 @@
+"""
+Bulk export and import of combinations as newline-delimited JSON, one combination per line:
+
+    {"server_id":123,"name":"intro","sounds":[456,789]}
+
+Both directions stream in batches, so a dump never has to fit in memory. Importing upserts by
+(server_id, name), replacing the sounds of existing combinations, so running it twice is harmless.
+"""
+
+import json
+import logging
+
+from combination_cache import combination_cache
+from storage import store
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 5000
+
+
+def encode(server_id, sound_name, sound_ids):
+    return json.dumps({"server_id": server_id, "name": sound_name, "sounds": list(sound_ids)},
+                      separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+def decode(line: str):
+    record = json.loads(line)
+    return int(record["server_id"]), str(record["name"]), [int(sound_id) for sound_id in record["sounds"]]
+
+
+async def export_combinations(write, server_id=None):
+    """Write every combination (or one server's) through write(str); returns how many were written"""
+    count = 0
+    async for server, sound_name, sound_ids in store.iter_combinations(server_id):
+        write(encode(server, sound_name, sound_ids))
+        count += 1
+    logger.info(f"Exported {count} combination(s)")
+    return count
+
+
+async def import_combinations(lines, server_id=None):
+    """Upsert combinations read from an iterable of lines; returns how many were imported.
+
+    With server_id every combination is imported into that server, which copies one server's
+    combinations to another.
+    """
+    count = 0
+    batch = {}  # (server id, name) -> sound ids; a later line for the same combination wins
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            server, sound_name, sound_ids = decode(line)
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Line {line_number} is not a valid combination: {e}") from e
+        batch[(server_id or server, sound_name)] = sound_ids
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            count += await _flush(batch)
+    count += await _flush(batch)
+    logger.info(f"Imported {count} combination(s)")
+    return count
+
+
+async def _flush(batch: dict):
+    if not batch:
+        return 0
+    await store.upsert_combinations([(server, sound_name, sound_ids) for (server, sound_name), sound_ids in batch.items()])
+    for server in {server for server, _ in batch}:
+        combination_cache.invalidate(server)
+    count = len(batch)
+    batch.clear()
+    return count
@@ -0,0 +1,106 @@
+import asyncio
+import itertools
+import logging
+import weakref
+from collections import OrderedDict
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceSessionManager:
+    """Keeps guild voice connections warm between plays and closes them once idle"""
+
+    def __init__(self, idle_timeout: float, max_idle: int):
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self._idle = OrderedDict()  # guild id -> (guild, task that disconnects after idle_timeout)
+        # guild id -> asyncio.Lock; an entry goes away once nothing holds or waits on the lock
+        self._locks = weakref.WeakValueDictionary()
+        # guild id -> number of its latest connect(), to spot reuse while a disconnect waits; dropped on disconnect
+        self._connect_ids = {}
+        self._connect_counter = itertools.count(1)
+        self._evictions = set()  # tasks closing connections evicted over max_idle
+
+    @property
+    def idle_count(self):
+        return len(self._idle)
+
+    def _lock(self, guild_id: int):
+        lock = self._locks.get(guild_id)
+        if lock is None:
+            lock = self._locks[guild_id] = asyncio.Lock()
+        return lock
+
+    async def connect(self, guild: discord.Guild, channel):
+        """Return a voice client in the channel, reusing or moving an existing connection"""
+        async with self._lock(guild.id):
+            self._cancel_idle(guild.id)
+            self._connect_ids[guild.id] = next(self._connect_counter)
+            voice_client = guild.voice_client
+            if voice_client and voice_client.is_connected():
+                if voice_client.channel != channel:
+                    await voice_client.move_to(channel)
+                return voice_client
+            if voice_client:
+                # Half-open connection left behind by a dropped session
+                await voice_client.disconnect(force=True)
+            return await channel.connect()
+
+    def release(self, guild: discord.Guild):
+        """Mark the guild's connection idle; it is closed after idle_timeout unless reused"""
+        if not guild.voice_client:
+            return
+        self._cancel_idle(guild.id)
+        self._idle[guild.id] = (guild, asyncio.create_task(self._disconnect_later(guild)))
+
+        # Cap idle connections process-wide by closing the ones idle the longest
+        while len(self._idle) > self.max_idle:
+            _, (oldest, task) = self._idle.popitem(last=False)
+            task.cancel()
+            logger.info(f"Too many idle voice connections, leaving voice in guild {oldest.id}")
+            task = asyncio.create_task(self._disconnect_unless_reused(oldest, self._connect_ids.get(oldest.id)))
+            self._evictions.add(task)
+            task.add_done_callback(self._evictions.discard)
+
+    def _cancel_idle(self, guild_id: int):
+        entry = self._idle.pop(guild_id, None)
+        if entry:
+            entry[1].cancel()
+
+    async def _disconnect_later(self, guild: discord.Guild):
+        await asyncio.sleep(self.idle_timeout)
+        # Under the guild's lock, so a connect() can't hand out the client while it is disconnecting
+        async with self._lock(guild.id):
+            entry = self._idle.get(guild.id)
+            if entry is None or entry[1] is not asyncio.current_task():
+                # Reused (or released again) while waiting for the lock
+                return
+            del self._idle[guild.id]
+            await self._disconnect(guild)
+
+    async def _disconnect_unless_reused(self, guild: discord.Guild, connect_id: int):
+        async with self._lock(guild.id):
+            if self._connect_ids.get(guild.id) == connect_id:
+                await self._disconnect(guild)
+
+    async def _disconnect(self, guild: discord.Guild):
+        # Called under the guild's lock
+        self._connect_ids.pop(guild.id, None)
+        if guild.voice_client:
+            await guild.voice_client.disconnect()
+
+    async def close(self, voice_clients):
+        """Cancel the idle timers and pending disconnects, then disconnect every given voice client at once"""
+        for guild_id in list(self._idle):
+            self._cancel_idle(guild_id)
+        for task in list(self._evictions):
+            task.cancel()
+        self._connect_ids.clear()
+        results = await asyncio.gather(
+            *(voice_client.disconnect(force=True) for voice_client in voice_clients), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Could not disconnect from voice: {result}")